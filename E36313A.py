@@ -1,15 +1,119 @@
-import pyvisa
+import visa_pool
 import time
+from typing import NamedTuple
+
+# Command completion: "opc" waits for *OPC? after each command, "sleep" waits a fixed time
+SYNC_MODES = ("opc", "sleep")
+# Wait after every command in the "sleep" profile (unit: s)
+SLEEP_PROFILE_S = 0.2
+# Maximum number of steps in a list sweep
+LIST_MAX_POINTS = 100
+
+def channel_list(channels):
+    """
+    - Return the SCPI channel list of the given channels, e.g. (@1,2,3)
+    """
+    return "(@" + ",".join(str(ch) for ch in channels) + ")"
+
+def setting_fields(setting: dict):
+    """
+    - Return the SCPI header and value of every field of a channel setting, in sending order
+    """
+    return {
+        "VOLT": setting.get("voltage", 0.0),
+        "CURR": setting.get("current", 0.0),
+        "VOLT:PROT": setting.get("ovp", 0.0),
+        "VOLT:PROT:STAT": "ON",
+        "CURR:PROT:STAT": "ON" if setting.get("ocp", False) else "OFF",
+        "OUTP": "ON" if setting.get("output", False) else "OFF",
+    }
+
+def compose_fields(fields: dict[int, dict]):
+    """
+    - Return the commands that apply the given fields of each channel,
+      using channel lists so channels sharing a value get a single command
+    """
+    cmds = []
+    for header in setting_fields({}):
+        groups: dict = {}
+        for ch, ch_fields in fields.items():
+            if header in ch_fields:
+                groups.setdefault(ch_fields[header], []).append(ch)
+        cmds += [f"{header} {value},{channel_list(chs)}" for value, chs in groups.items()]
+    return cmds
+
+def parse_channels(resp, n_queries, n_channels):
+    """
+    - Split a compound channel-list response into one list of strings per query
+    """
+    values = [answer.split(",") for answer in resp.split(";")]
+    if len(values) != n_queries or any(len(v) != n_channels for v in values):
+        raise ValueError(f"응답 형식 오류: {resp}")
+    return values
+
+class ChannelReading(NamedTuple):
+    voltage: float
+    current: float
+
+class SettleTracker:
+    def __init__(self, ch_list, targets: dict[int, float] | None = None, v_tol=0.005, i_tol=0.001,
+                 target_tol=0.02, stable_count=3):
+        """
+        - Initialize the class
+        - Feed readings with update(); the outputs count as settled once stable_count
+          consecutive readings agree within v_tol/i_tol (and lie within target_tol,
+          relative, of targets if given)
+        """
+        self.ch_list = ch_list
+        self.targets = targets
+        self.v_tol = v_tol
+        self.i_tol = i_tol
+        self.target_tol = target_tol
+        self.stable_count = stable_count
+        self.__previous = None
+        self.__stable = 0
+        self.__settled_at = None
+
+    def update(self, reading: dict[int, ChannelReading], now):
+        """
+        - Add a reading taken at time now(unit: s)
+        - Return the time of the first reading of the stable run once settled, else None
+        """
+        on_target = self.targets is None or all(
+            abs(reading[ch].voltage - v) <= max(self.v_tol, self.target_tol * abs(v))
+            for ch, v in self.targets.items() if ch in reading)
+        steady = self.__previous is not None and all(
+            abs(reading[ch].voltage - self.__previous[ch].voltage) <= self.v_tol and
+            abs(reading[ch].current - self.__previous[ch].current) <= self.i_tol for ch in self.ch_list)
+
+        if not on_target:
+            self.__stable = 0
+        elif self.__stable and steady:
+            self.__stable += 1
+        else:
+            self.__stable, self.__settled_at = 1, now
+
+        self.__previous = reading
+        return self.__settled_at if self.__stable >= self.stable_count else None
 
 class E36313A:
-    def __init__(self, ip='192.168.0.5'):
+    def __init__(self, ip='192.168.0.5', sync="opc", timeout_s=5.0):
         """
         - Initialize the class
+        - sync selects how command completion is awaited (see SYNC_MODES),
+          timeout_s bounds every *OPC? wait and query
         """
         self.__ip = ip
         self.__inst = None
+        # Socket generation the cached output state belongs to (see visa_pool.PooledResource)
+        self.__generation = None
+        self.__sync = "opc"
+        self.__timeout_s = timeout_s
+        self.set_sync(sync, timeout_s)
         self.__settings_dict: dict[int, dict] = {}
         self.__channels = [1, 2, 3]
+        # Last value sent for every SCPI header of each channel
+        self.__applied: dict[int, dict] = {ch: {} for ch in self.__channels}
 
     def set_ip(self, ip: str):
         """
@@ -23,18 +127,52 @@ class E36313A:
         """
         return self.__ip
 
+    def set_sync(self, sync, timeout_s=None):
+        """
+        - Select the completion mode ("opc" or "sleep") and the completion timeout(unit: s)
+        """
+        if sync not in SYNC_MODES:
+            raise ValueError(f"지원하지 않는 동기화 모드: {sync} {SYNC_MODES}")
+        self.__sync = sync
+        if timeout_s is not None:
+            self.__timeout_s = timeout_s
+        if self.__inst:
+            self.__inst.timeout = int(self.__timeout_s * 1000)
+
+    def get_sync(self):
+        """
+        - Return the completion mode
+        """
+        return self.__sync
+
+    def invalidate(self, ch=None):
+        """
+        - Forget the cached output state of one channel, or of all channels,
+          so the next setting() sends every field again
+        """
+        for c in (self.__channels if ch is None else [ch]):
+            self.__applied[c] = {}
+
+    def reset(self):
+        """
+        - Reset the instrument (*RST) and clear the cached output state
+        """
+        self.invalidate()
+        return self.scpi_write("*RST")
+
     def connect_device(self):
         """
         - Connect to the device
         """
         try:
-            resource = f"TCPIP0::{self.__ip}::5025::SOCKET"
-            rm = pyvisa.ResourceManager()
-            self.__inst = rm.open_resource(resource)
-            self.__inst.write_termination = '\n'
-            self.__inst.read_termination = '\n'
-
-            idn = self.__inst.query("*IDN?").strip()
+            # Reuses the pooled socket if this instrument was connected before
+            self.__inst = visa_pool.get_resource(self.__ip)
+            self.__inst.timeout = int(self.__timeout_s * 1000)
+            # The instrument state is unknown after (re)connecting
+            self.invalidate()
+            self.__generation = self.__inst.generation
+
+            idn = self.__inst.idn()
             print(f"[E36313A 연결 성공] {idn}")
             return True
 
@@ -45,13 +183,23 @@ class E36313A:
     def scpi_write(self, cmd):
         """
         - Send an SCPI command
+        - Return True on success; a failure invalidates the cached output state
         """
         try:
-            self.__inst.write(cmd)
+            if self.__sync == "opc":
+                # *OPC? is answered once the command has been executed; if it times out,
+                # the pool drops the socket so the late "1" is not read by the next query
+                if self.__inst.query(f"{cmd};*OPC?").strip() != "1":
+                    raise IOError("*OPC? 응답 오류")
+            else:
+                self.__inst.write(cmd)
+                time.sleep(SLEEP_PROFILE_S)
             print(f"[WRITE] {cmd}")
-            time.sleep(0.2)
+            return True
         except Exception as e:
             print(f"[명령 실패]: {cmd}, [오류]: {e}")
+            self.invalidate()
+            return False
 
     def scpi_query(self, cmd):
         """
@@ -60,19 +208,65 @@ class E36313A:
         try:
             resp = self.__inst.query(cmd).strip()
             print(f"[QUERY] {cmd} → {resp}")
-            time.sleep(0.2)
+            # A query is complete once its response has arrived
+            if self.__sync == "sleep":
+                time.sleep(SLEEP_PROFILE_S)
             return resp
         except Exception as e:
             print(f"[명령 실패]: {cmd}, [오류]: {e}")
             return None
 
+    def scpi_batch(self, cmds):
+        """
+        - Send several SCPI commands as one semicolon-separated message
+        - Every command is rooted with ':' so it does not inherit the previous header path
+        """
+        if not cmds:
+            return True
+        return self.scpi_write(";:".join(cmds))
+
+    def check_connection(self):
+        """
+        - Forget the cached output state if the pooled socket was reopened since it was
+          recorded; the instrument may have been power-cycled in between
+        - Return True if the cache was cleared
+        """
+        if self.__inst is None or self.__inst.generation == self.__generation:
+            return False
+        print("[E36313A 재연결 감지] 출력 상태 캐시 초기화")
+        self.invalidate()
+        self.__generation = self.__inst.generation
+        return True
+
+    def changed_fields(self, settings_dict: dict[int, dict], ch_list):
+        """
+        - Return, per channel, the fields whose value differs from the cached output state
+        """
+        self.check_connection()
+        changed = {}
+        for ch in ch_list:
+            applied = self.__applied[ch]
+            changed[ch] = {header: value for header, value in setting_fields(settings_dict[ch]).items()
+                           if header not in applied or applied[header] != value}
+        return changed
+
+    def apply_fields(self, fields: dict[int, dict]):
+        """
+        - Send the given fields in one SCPI message and record them as applied
+        """
+        if not self.scpi_batch(compose_fields(fields)):
+            raise IOError("설정 전송 실패")
+        # Sent over a reopened socket: only these fields are known to be applied
+        self.check_connection()
+        for ch, ch_fields in fields.items():
+            self.__applied[ch].update(ch_fields)
+
     def pwr_on(self, ch):
         """
         - Turn on the output of a specific channel
         """
         try:
-            self.scpi_write(f"INST:NSEL {ch}")
-            self.scpi_write(f"OUTP ON")
+            self.apply_fields({ch: {"OUTP": "ON"}})
             print(f"[출력 ON] - CH{ch}의 출력 ON")
             return True
         except Exception as e:
@@ -84,8 +278,7 @@ class E36313A:
         - Turn off the output of a specific channel
         """
         try:
-            self.scpi_write(f"INST:NSEL {ch}")
-            self.scpi_write(f"OUTP OFF")
+            self.apply_fields({ch: {"OUTP": "OFF"}})
             print(f"[출력 OFF] - CH{ch}의 출력 OFF")
             return True
         except Exception as e:
@@ -95,34 +288,87 @@ class E36313A:
     def setting(self, settings_dict: dict[int, dict], ch_list):
         """
         - Apply settings (voltage, current, protection) to multiple channels
+        - All channels are configured with a single SCPI message that only carries
+          the fields which changed since the last setting
+        - If that message had to be sent over a reopened socket, the fields skipped as
+          unchanged are sent as well
         """
         self.__settings_dict = settings_dict
 
-        for ch in ch_list:
-            setting = self.__settings_dict.get(ch)
-
-            try:
-                voltage = setting.get("voltage", 0.0)
-                current = setting.get("current", 0.0)
-                ovp = setting.get("ovp", 0.0)
-                ocp_state = setting.get("ocp", False)
-                output_state = setting.get("output", False)
-
-                self.scpi_write(f"INST:NSEL {ch}")
-                self.scpi_write(f"VOLT {voltage}")
-                self.scpi_write(f"CURR {current}")
-                self.scpi_write(f"VOLT:PROT {ovp}")
-                self.scpi_write("VOLT:PROT:STAT ON")
-                self.scpi_write(f"CURR:PROT:STAT {'ON' if ocp_state else 'OFF'}")
-                self.scpi_write(f"OUTP {'ON' if output_state else 'OFF'}")
-
+        try:
+            for _ in range(2):
+                generation = self.__inst.generation
+                self.apply_fields(self.changed_fields(self.__settings_dict, ch_list))
+                if self.__inst.generation == generation:
+                    break
+
+            for ch in ch_list:
+                fields = setting_fields(self.__settings_dict[ch])
                 print(
-                    f"[CH{ch}] [설정값] → V:{voltage}, I:{current}, OVP:{ovp}, OCP:{'ON' if ocp_state else 'OFF'}, OUT:{'ON' if output_state else 'OFF'}")
-                return True
+                    f"[CH{ch}] [설정값] → V:{fields['VOLT']}, I:{fields['CURR']}, OVP:{fields['VOLT:PROT']}, OCP:{fields['CURR:PROT:STAT']}, OUT:{fields['OUTP']}")
+            return True
+
+        except Exception as e:
+            print(f"[CH{list(ch_list)}] [오류 - 설정 실패]: {e}")
+            return False, e
+
+    def query_channels(self, queries, ch_list=None):
+        """
+        - Send several channel-list queries in one SCPI message
+        - Return one list of per-channel response strings for each query
+        """
+        ch_list = ch_list or self.__channels
+        chans = channel_list(ch_list)
+        resp = self.scpi_query(";:".join(f"{query} {chans}" for query in queries))
+        if resp is None:
+            raise IOError("응답 없음")
+
+        return parse_channels(resp, len(queries), len(ch_list))
+
+    def measure_all(self, ch_list=None):
+        """
+        - Return the measured voltage and current of every channel with a single query
+          as {ch: ChannelReading(voltage, current)}
+        """
+        ch_list = ch_list or self.__channels
+        try:
+            volts, currs = self.query_channels(["MEAS:VOLT?", "MEAS:CURR?"], ch_list)
+            return {ch: ChannelReading(float(v), float(i)) for ch, v, i in zip(ch_list, volts, currs)}
+
+        except Exception as e:
+            print(f"[CH{list(ch_list)}] [오류 - 측정값 읽기]: {e}")
+            return None
 
-            except Exception as e:
-                print(f"[CH{ch}] [오류 - 설정 실패]: {e}")
-                return False, e
+    def wait_settled(self, ch_list=None, targets: dict[int, float] | None = None, v_tol=0.005, i_tol=0.001,
+                     target_tol=0.02, stable_count=3, interval_s=0.02, timeout_s=2.0):
+        """
+        - Poll voltage and current until stable_count consecutive readings agree within
+          v_tol/i_tol (see SettleTracker)
+        - With targets, the voltages must also lie within target_tol (relative) of them;
+          by default only stability is checked, since readback accuracy and load can keep
+          the output off the setpoint by more than v_tol
+        - Return the settle time(unit: s), measured from the call to the first reading of
+          the stable run, or None if the outputs did not settle within timeout_s
+        """
+        ch_list = ch_list or self.__channels
+        tracker = SettleTracker(ch_list, targets, v_tol, i_tol, target_tol, stable_count)
+        start = time.perf_counter()
+
+        while True:
+            now = time.perf_counter() - start
+            reading = self.measure_all(ch_list)
+            if reading is None:
+                return None
+
+            settled_at = tracker.update(reading, now)
+            if settled_at is not None:
+                print(f"[CH{list(ch_list)}] [출력 안정] {settled_at * 1e3:.1f} ms")
+                return settled_at
+            if now >= timeout_s:
+                print(f"[CH{list(ch_list)}] [출력 안정 시간 초과] {timeout_s} s")
+                return None
+
+            time.sleep(interval_s)
 
     def status_voltage(self, ch):
         """
@@ -167,8 +413,21 @@ class E36313A:
         - Return the current voltage, current, and output state of all channels
         """
         statuses = {}
-        for ch in self.__channels:
-            statuses[ch] = self.status_ch(ch)
+        try:
+            volts, currs, outputs = self.query_channels(["MEAS:VOLT?", "MEAS:CURR?", "OUTP?"])
+        except Exception as e:
+            print(f"[CH{self.__channels}] [오류 - 현재 상태]: {e}")
+            return {ch: (False, e) for ch in self.__channels}
+
+        for idx, ch in enumerate(self.__channels):
+            status = {
+                "voltage": float(volts[idx]),
+                "current": float(currs[idx]),
+                "output": (outputs[idx] == '1')
+            }
+            print(
+                f"[CH{ch}] [현재 상태] → V:{status['voltage']}V, I:{status['current']}A, 출력:{'ON' if status['output'] else 'OFF'}")
+            statuses[ch] = (True, status)
         return statuses
 
     def full_status_all(self):
@@ -176,29 +435,23 @@ class E36313A:
         - Return full status including protection for all channels
         """
         statuses = {}
-        for ch in self.__channels:
-            try:
-                self.scpi_write(f"INST:NSEL {ch}")
-                voltage = float(self.scpi_query("MEAS:VOLT?"))
-                current = float(self.scpi_query("MEAS:CURR?"))
-                output = (self.scpi_query("OUTP?") == '1')
-                ovp = float(self.scpi_query("VOLT:PROT?"))
-                ovp_on = self.scpi_query("VOLT:PROT:STAT?") == '1'
-                ocp_on = self.scpi_query("CURR:PROT:STAT?") == '1'
+        try:
+            volts, currs, outputs, ovps, ovp_ons, ocp_ons = self.query_channels(
+                ["MEAS:VOLT?", "MEAS:CURR?", "OUTP?", "VOLT:PROT?", "VOLT:PROT:STAT?", "CURR:PROT:STAT?"])
 
+            for idx, ch in enumerate(self.__channels):
                 statuses[ch] = {
-                    "voltage": voltage,
-                    "current": current,
-                    "output": output,
-                    "ovp": ovp,
-                    "ovp_on": ovp_on,
-                    "ocp_on": ocp_on
+                    "voltage": float(volts[idx]),
+                    "current": float(currs[idx]),
+                    "output": outputs[idx] == '1',
+                    "ovp": float(ovps[idx]),
+                    "ovp_on": ovp_ons[idx] == '1',
+                    "ocp_on": ocp_ons[idx] == '1'
                 }
 
-            except Exception as e:
-                print(f"[CH{ch}] 상태 읽기 실패: {e}")
-                statuses[ch] = None
-                return False, e
+        except Exception as e:
+            print(f"[CH{self.__channels}] 상태 읽기 실패: {e}")
+            return False, e
 
         return statuses
 
@@ -208,6 +461,7 @@ class E36313A:
         """
         try:
             self.scpi_write(f'APPL CH{channel},{voltage},1')
+            self.invalidate(channel)
             print(f'[설정] 채널 {channel} 전압을 {voltage}V로 설정')
             return True
 
@@ -230,21 +484,65 @@ class E36313A:
 
     def apply_channel_setting(self, setting: dict, ch: int):
         """
-        - Apply a full setting dictionary to a single channel
+        - Apply a full setting dictionary to a single channel in one SCPI message
         """
-        self.scpi_write(f"INST:NSEL {ch}")
-        self.scpi_write(f"VOLT {setting['voltage']}")
-        self.scpi_write(f"CURR {setting['current']}")
-        self.scpi_write(f"VOLT:PROT {setting['ovp']}")
-        self.scpi_write("VOLT:PROT:STAT ON")
-        self.scpi_write(f"CURR:PROT:STAT {'ON' if setting.get('ocp') else 'OFF'}")
-        if setting.get('output'):
-            self.scpi_write("OUTP ON")
+        self.apply_fields(self.changed_fields({ch: setting}, [ch]))
+        return bool(setting.get('output'))
+
+    def arm_list(self, voltages: dict[int, list], currents: dict[int, float], dwell_s=0.01):
+        """
+        - Upload a voltage list per channel and arm it for bus-triggered stepping
+        - Every trigger() moves all armed channels to their next list point; the lists
+          repeat until abort_list()
+        """
+        ch_list = list(voltages)
+        try:
+            n_points = {len(v) for v in voltages.values()}
+            if len(n_points) != 1:
+                raise ValueError("채널별 리스트 길이가 다름")
+            n_points = n_points.pop()
+            if not 0 < n_points <= LIST_MAX_POINTS:
+                raise ValueError(f"리스트 길이 {n_points} (1~{LIST_MAX_POINTS})")
+
+            cmds = []
+            for ch in ch_list:
+                chans = channel_list([ch])
+                cmds += [f"LIST:VOLT {','.join(str(v) for v in voltages[ch])},{chans}",
+                         f"LIST:CURR {','.join([str(currents[ch])] * n_points)},{chans}",
+                         f"LIST:DWEL {','.join([str(dwell_s)] * n_points)},{chans}"]
+
+            chans = channel_list(ch_list)
+            cmds += [f"LIST:STEP ONCE,{chans}", f"LIST:COUN INF,{chans}",
+                     f"VOLT:MODE LIST,{chans}", f"CURR:MODE LIST,{chans}",
+                     f"TRIG:SOUR BUS,{chans}", f"INIT {chans}"]
+
+            # Voltage and current now follow the list, not the cached values
+            for ch in ch_list:
+                self.invalidate(ch)
+            if not self.scpi_batch(cmds):
+                raise IOError("리스트 전송 실패")
+
+            print(f"[CH{ch_list}] [리스트 설정] {n_points} points")
             return True
 
-        else:
-            self.scpi_write("OUTP OFF")
-            return False
+        except Exception as e:
+            print(f"[CH{ch_list}] [오류 - 리스트 설정 실패]: {e}")
+            return False, e
+
+    def trigger(self):
+        """
+        - Step every armed list to its next point (*TRG)
+        """
+        return self.scpi_write("*TRG")
+
+    def abort_list(self, ch_list=None):
+        """
+        - Stop the list sweep and return the channels to fixed voltage/current
+        """
+        chans = channel_list(ch_list or self.__channels)
+        for ch in (ch_list or self.__channels):
+            self.invalidate(ch)
+        return self.scpi_batch([f"ABOR {chans}", f"VOLT:MODE FIX,{chans}", f"CURR:MODE FIX,{chans}"])
 
     def buff_clear(self):
         """
@@ -1,7 +1,17 @@
-import pyvisa
-import time
+import visa_pool
 from datetime import datetime
 
+import numpy as np
+
+# Default *OPC? timeout per operation (unit: s)
+OPC_TIMEOUTS_S = {
+    "default": 5.0,     # settings
+    "mode": 60.0,       # application switch (INST:SEL)
+    "adjust": 60.0,     # SENS:ADJ auto setup
+    "sweep": 120.0,     # single sweep (phase noise sweeps are slow)
+    "capture": 30.0,    # screenshot to file
+}
+
 class FSV3000:
     def __init__(self, ip='192.168.0.6'):
         """
@@ -21,6 +31,7 @@ class FSV3000:
         self.__offset_stop = None
 
         self.sau_usb_dir = "D:/"
+        self.opc_timeouts_s = dict(OPC_TIMEOUTS_S)
 
     def set_ip(self, ip: str):
         """
@@ -39,13 +50,10 @@ class FSV3000:
         - Connect to the device
         """
         try:
-            resource = f"TCPIP0::{self.__ip}::5025::SOCKET"
-            rm = pyvisa.ResourceManager()
-            self.__inst = rm.open_resource(resource)
-            self.__inst.write_termination = '\n'
-            self.__inst.read_termination = '\n'
+            # Reuses the pooled socket if this instrument was connected before
+            self.__inst = visa_pool.get_resource(self.__ip)
 
-            idn = self.__inst.query("*IDN?").strip()
+            idn = self.__inst.idn()
             print(f"[FSV3000 연결 성공] {idn}")
             return True
 
@@ -53,6 +61,27 @@ class FSV3000:
             print(f"[FSV3000 연결 실패] {e}")
             return False
 
+    def wait_opc(self, cmd, operation="default"):
+        """
+        - Send cmd followed by *OPC? and return once the analyzer reports it complete,
+          bounded by the timeout of the given operation (see OPC_TIMEOUTS_S)
+        - On a timeout or a wrong reply the pooled socket is closed before the error is
+          raised, so a late "1" is not read as the answer to the next query; the next call
+          reconnects
+        """
+        timeout_ms = self.__inst.timeout
+        self.__inst.timeout = int(self.opc_timeouts_s[operation] * 1000)
+        try:
+            if self.__inst.query(f"{cmd};*OPC?").strip() != "1":
+                raise IOError(f"*OPC? 응답 오류: {cmd}")
+            return True
+        except Exception as e:
+            print(f"[*OPC? 대기 실패] {operation}: {cmd}, {e}")
+            self.__inst.close()
+            raise
+        finally:
+            self.__inst.timeout = timeout_ms
+
     def set_frequency(self, center_freq_hz):
         """
         - Set the center frequency(unit: Hz)
@@ -73,7 +102,7 @@ class FSV3000:
         """
         self.__span_hz = span_hz
         try:
-            self.__inst.write(f"FREQ:SPAN {self.__span_hz}")
+            self.wait_opc(f"FREQ:SPAN {self.__span_hz}")
             print(f"[Sapn 설정] {self.__span_hz:.3e} Hz")
             return True
 
@@ -139,9 +168,8 @@ class FSV3000:
         """
         try:
             self.__inst.write("INIT:CONT OFF")
-            self.__inst.write("INIT:IMM")
+            self.wait_opc("INIT:IMM", "sweep")
             print("[Single Sweep] 실행")
-            time.sleep(1)
             return True
 
         except Exception as e:
@@ -155,23 +183,35 @@ class FSV3000:
         try:
             self.__inst.write("INIT:CONT ON")
             print("[Continuous Sweep] 실행")
-            time.sleep(1)
             return True
 
         except Exception as e:
             print(f"[오류 - Continuous Sweep] {e}")
             return False, e
 
-    def get_trace(self):
+    def get_trace(self, trace=1):
         """
         - Get trace data from the spectrum analyzer
+        - The trace is transferred as a REAL,32 binary block and decoded straight into a
+          float32 array; return (frequency axis(unit: Hz), trace(unit: dBm))
         """
         try:
-            self.__inst.write("FORM ASC")
-            data = self.__inst.query("TRAC? TRACE1")
-            trace_data = list(map(float, data.strip().split(',')))
-            print(f"[Trace 획득] {(trace_data)} 포인트")
-            return trace_data
+            start, stop, points = self.__inst.query("FREQ:STAR?;:FREQ:STOP?;:SWE:POIN?").strip().split(";")
+
+            self.__inst.write("FORM REAL,32;:FORM:BORD SWAP")
+            try:
+                trace_data = self.__inst.query_binary_values(f"TRAC? TRACE{trace}", datatype='f',
+                                                             is_big_endian=False, container=np.array)
+            finally:
+                self.__inst.write("FORM ASC")
+
+            trace_data = np.asarray(trace_data, dtype=np.float32)
+            freq_axis = np.linspace(float(start), float(stop), int(float(points)))
+            if len(freq_axis) != len(trace_data):
+                freq_axis = np.linspace(float(start), float(stop), len(trace_data))
+
+            print(f"[Trace 획득] {len(trace_data)} 포인트")
+            return freq_axis, trace_data
 
         except Exception as e:
             print(f"[오류 - Trace] {e}")
@@ -183,7 +223,7 @@ class FSV3000:
         """
         try:
             self.__inst.write("INIT:CONT OFF")
-            self.__inst.write("SENS:ADJ:ALL")
+            self.wait_opc("SENS:ADJ:ALL", "adjust")
             print("[Auto Set] 전체 자동 설정 실행됨")
             return True
 
@@ -249,7 +289,8 @@ class FSV3000:
         - Enable spectrum marker table window
         """
         try:
-            self.__inst.write("INIT:IMM")
+            # Sweep with the current settings before the marker table is read
+            self.wait_opc("INIT:IMM", "sweep")
             temp = self.__inst.query("LAY:ADD:WIND? '1',BEL,MTAB")
             print(f"[Spectrum Marker table 설정 완료]")
             return True
@@ -312,8 +353,7 @@ class FSV3000:
         - Switch Spectrum plot
         """
         try:
-            self.__inst.write("INST:SEL 'Spectrum'")
-            time.sleep(5.0)
+            self.wait_opc("INST:SEL 'Spectrum'", "mode")
             print(f"[Spectrum 전환] 완료")
             return True
 
@@ -326,8 +366,7 @@ class FSV3000:
         - Switch Phase Noise plot
         """
         try:
-            self.__inst.write("INST:SEL 'PNOISE'")
-            time.sleep(15.0)
+            self.wait_opc("INST:SEL 'PNOISE'", "mode")
             self.__inst.write("SENS:FREQ:VER:STAT OFF")
             self.__inst.write("SENS:POW:RLEV:VER:STAT OFF")
             print(f"[Phase noise 전환] 완료")
@@ -341,31 +380,33 @@ class FSV3000:
         """
         - Return RMS jitter(unit: ps)
         """
-        self.__offset_start = offset_start
-        self.__offset_stop = offset_stop
-        self.__rbw_ratio = rbw_ratio
+        try:
+            self.__offset_start = offset_start
+            self.__offset_stop = offset_stop
+            self.__rbw_ratio = rbw_ratio
 
-        self.__inst.write(f"SENS:FREQ:STAR {self.__offset_start}")
-        self.__inst.write(f"SENS:FREQ:STOP {self.__offset_stop}")
-        self.__inst.write(f"SENS:LIST:BWID:RAT {self.__rbw_ratio}")
-        time.sleep(5)
-        print(f"[오프셋 시작 설정 완료]: {self.__offset_start}")
-        print(f"[오프셋 종료 설정 완료]: {self.__offset_stop}")
-        print(f"[RBW 설정] {self.__rbw_ratio} %")
+            self.__inst.write(f"SENS:FREQ:STAR {self.__offset_start}")
+            self.__inst.write(f"SENS:FREQ:STOP {self.__offset_stop}")
+            self.wait_opc(f"SENS:LIST:BWID:RAT {self.__rbw_ratio}")
+            print(f"[오프셋 시작 설정 완료]: {self.__offset_start}")
+            print(f"[오프셋 종료 설정 완료]: {self.__offset_stop}")
+            print(f"[RBW 설정] {self.__rbw_ratio} %")
 
-        self.__inst.write("SENS:ADJ:ALL")
-        print("[Auto Set] 전체 자동 설정 실행됨")
-        time.sleep(15.0)
+            self.wait_opc("SENS:ADJ:ALL", "adjust")
+            print("[Auto Set] 전체 자동 설정 실행됨")
 
-        self.__inst.write("INIT:CONT OFF")
-        self.__inst.write("INIT:IMM")
-        print("[Single Sweep] 실행")
-        time.sleep(5.0)
+            self.__inst.write("INIT:CONT OFF")
+            self.wait_opc("INIT:IMM", "sweep")
+            print("[Single Sweep] 실행")
 
-        jitter_sec = self.__inst.query("FETC:PNO:RMS?")
-        jitter_ps = float(jitter_sec) * 1e12
-        print(f"Residual RMS Jitter: {jitter_ps:.2f} ps")
-        return jitter_ps
+            jitter_sec = self.__inst.query("FETC:PNO:RMS?")
+            jitter_ps = float(jitter_sec) * 1e12
+            print(f"Residual RMS Jitter: {jitter_ps:.2f} ps")
+            return jitter_ps
+
+        except Exception as e:
+            print(f"[오류 - 지터 측정] {e}")
+            return False, e
 
     def capture_spectrum(self, path, postfix=None):
         """
@@ -374,12 +415,11 @@ class FSV3000:
         nowtime = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.__usb_path = path
         try:
-            self.__inst.write("INST:SEL 'Spectrum'")
-            time.sleep(5.0)
+            self.wait_opc("INST:SEL 'Spectrum'", "mode")
             self.__inst.write("HCOP:DEST 'MMEM'")
             self.__inst.write("HCOP:DEV:LANG JPG")
             self.__inst.write(f"MMEM:NAME '{self.__usb_path}/{f"{postfix}" if postfix else ''}spectrum_{nowtime}'")
-            self.__inst.write("HCOP:IMM")
+            self.wait_opc("HCOP:IMM", "capture")
             print(f"[Spectrum Capture] 파일 저장: {self.__usb_path}")
             return True
 
@@ -394,13 +434,12 @@ class FSV3000:
         nowtime = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.__usb_path = path
         try:
-            self.__inst.write("INST:SEL 'PNOISE'")
-            time.sleep(15.0)  # Ensure time for phase noise initialization
+            self.wait_opc("INST:SEL 'PNOISE'", "mode")
             self.__inst.write("HCOP:DEST 'MMEM'")
             self.__inst.write("HCOP:DEV:LANG JPG")
             self.__inst.write(f"MMEM:NAME '{self.__usb_path}/{f"{postfix}" if postfix else ''}"
                               f"phase_noise_{nowtime}'")
-            self.__inst.write("HCOP:IMM")
+            self.wait_opc("HCOP:IMM", "capture")
             print(f"[Phase Noise Capture] 파일 저장: {self.__usb_path}")
             return True
 
@@ -449,7 +488,7 @@ class FSV3000:
         - Move marker to peak value
         """
         try:
-            self.__inst.write("CALC:MARK:MAX")
+            self.wait_opc("CALC:MARK:MAX")
             print("[피크 탐색]")
             return True
 
@@ -1,6 +1,13 @@
-import pyvisa
+import visa_pool
 import time
 import math
+from typing import NamedTuple
+
+class GeneratorStatus(NamedTuple):
+    freq: float     # unit: Hz
+    dBm: float      # unit: dBm
+    RMS: float      # unit: mV (50 Ω)
+    RF_ON: bool
 
 class SMB100B:
     """
@@ -9,8 +16,14 @@ class SMB100B:
     def __init__(self, ip='169.254.144.100'):
         self.__ip = ip
         self.__inst = None
+        # Socket generation the cached state belongs to (see visa_pool.PooledResource)
+        self.__generation = None
+        # Last applied state; None means unknown and forces the next write
         self.__freq_hz = None
         self.__dbm = None
+        self.__rf_on = None
+        self.__freq_list = []
+        self.__power_list = []
 
     def set_ip(self, ip: str):
         """
@@ -24,18 +37,52 @@ class SMB100B:
         """
         return self.__ip
 
+    def invalidate(self):
+        """
+        - Forget the cached frequency, power and output state
+        """
+        self.__freq_hz = None
+        self.__dbm = None
+        self.__rf_on = None
+
+    def check_connection(self):
+        """
+        - Forget the cached state if the pooled socket was reopened since it was recorded;
+          the instrument may have been power-cycled in between
+        """
+        if self.__inst is not None and self.__inst.generation != self.__generation:
+            print("[SMB100B 재연결 감지] 상태 캐시 초기화")
+            self.invalidate()
+            self.__generation = self.__inst.generation
+
+    def refresh(self):
+        """
+        - Resynchronise the cached state from the instrument with one compound query
+        - Return (frequency(unit: Hz), power(unit: dBm), RF state)
+        """
+        try:
+            freq, dbm, rf = self.__inst.query("SOUR:FREQ?;:SOUR:POW?;:OUTP?").strip().split(";")
+            self.__generation = self.__inst.generation
+            self.__freq_hz, self.__dbm, self.__rf_on = float(freq), float(dbm), rf.strip() == "1"
+            return self.__freq_hz, self.__dbm, self.__rf_on
+
+        except Exception as e:
+            print(f"[오류 - 상태 동기화] {e}")
+            self.invalidate()
+            return None
+
     def connect_device(self):
         """
         - Connect to the device
         """
         try:
-            resource = f"TCPIP0::{self.__ip}::5025::SOCKET"
-            rm = pyvisa.ResourceManager()
-            self.__inst = rm.open_resource(resource)
-            self.__inst.write_termination = '\n'
-            self.__inst.read_termination = '\n'
+            # Reuses the pooled socket if this instrument was connected before
+            self.__inst = visa_pool.get_resource(self.__ip)
+            # The instrument state is unknown after (re)connecting
+            self.invalidate()
+            self.__generation = self.__inst.generation
 
-            idn = self.__inst.query("*IDN?").strip()
+            idn = self.__inst.idn()
             print(f"[SMB100B 연결 성공] {idn}")
             return True
 
@@ -45,88 +92,171 @@ class SMB100B:
 
     def set_frequency(self, freq_hz):
         """
-        - Set the output frequency(Unit: Hz)
+        - Set the output frequency(Unit: Hz); nothing is sent if it is already applied
         """
-        self.__freq_hz = freq_hz
+        self.check_connection()
+        if self.__freq_hz == freq_hz:
+            return True
 
         try:
-            self.__inst.write(f"SOUR:FREQ {self.__freq_hz}")
+            self.__inst.write(f"SOUR:FREQ {freq_hz}")
+            self.check_connection()
+            self.__freq_hz = freq_hz
             print(f"[주파수 설정] {self.__freq_hz} Hz")
             time.sleep(0.1)
             return True
 
         except Exception as e:
             print(f"[오류 - 주파수 설정] {e}")
+            self.invalidate()
             return False, e
 
     def set_power(self, dbm):
         """
-        - Set the output power level(unit: dBm)
+        - Set the output power level(unit: dBm); nothing is sent if it is already applied
         """
-        self.__dbm = dbm
+        self.check_connection()
+        if self.__dbm == dbm:
+            return True
 
         try:
-            self.__inst.write(f"SOUR:POW {self.__dbm}")
+            self.__inst.write(f"SOUR:POW {dbm}")
+            self.check_connection()
+            self.__dbm = dbm
             print(f"[출력 설정] {self.__dbm} dBm")
             time.sleep(0.1)
             return True
 
         except Exception as e:
             print(f"[오류 - 출력 설정] {e}")
+            self.invalidate()
             return False, e
 
     def rf_on(self):
         """
-        - Enable RF output
+        - Enable RF output; nothing is sent if it is already on
         """
+        self.check_connection()
+        if self.__rf_on:
+            return True
+
         try:
             self.__inst.write("OUTP ON")
+            self.check_connection()
+            self.__rf_on = True
             print("[RF 출력] ON")
             return True
         except Exception as e:
             print(f"[오류 - RF 출력 ON] {e}")
+            self.invalidate()
             return False, e
 
     def rf_off(self):
         """
-        - Disable RF output
+        - Disable RF output; nothing is sent if it is already off
         """
+        self.check_connection()
+        if self.__rf_on is False:
+            return True
+
         try:
             self.__inst.write("OUTP OFF")
+            self.check_connection()
+            self.__rf_on = False
             print("[RF 출력] OFF")
             return True
         except Exception as e:
             print(f"[오류 - RF 출력 OFF] {e}")
+            self.invalidate()
             return False, e
 
-    def query_status(self):
+    def arm_list(self, freq_list_hz, power_dbm, dwell_s=0.01, name="pinchoff_sweep"):
         """
-        - Return the current status(frequency, power, RMS voltage, RF state)
+        - Upload a frequency list (and a constant or per-point power list) once,
+          switch to list mode in STEP mode and enable RF output
+        - Points are then selected with list_index()
         """
-        if not self.connect_device():
-            return
+        freq_list_hz = list(freq_list_hz)
+        power_list = list(power_dbm) if isinstance(power_dbm, (list, tuple)) else [power_dbm] * len(freq_list_hz)
+
         try:
-            freq = float(self.__inst.query("SOUR:FREQ?").strip())
-            power_dbm = float(self.__inst.query("SOUR:POW?").strip())
-            rf = self.__inst.query("OUTP?").strip()
+            if not freq_list_hz or len(power_list) != len(freq_list_hz):
+                raise ValueError("주파수/전력 리스트 길이 오류")
+
+            self.__inst.write(f'SOUR:LIST:SEL "{name}"')
+            self.__inst.write(f"SOUR:LIST:FREQ {','.join(str(f) for f in freq_list_hz)}")
+            self.__inst.write(f"SOUR:LIST:POW {','.join(str(p) for p in power_list)}")
+            self.__inst.write(f"SOUR:LIST:DWEL {dwell_s}")
+            self.__inst.write("SOUR:LIST:MODE STEP")
+            self.__inst.write("SOUR:LIST:IND 0")
+            self.__inst.write("SOUR:FREQ:MODE LIST")
+            self.__inst.write("OUTP ON")
+            # Wait until the list is loaded before the first step
+            self.__inst.query("*OPC?")
 
-            # dBm → mV RMS 변환 (50Ω 기준)
-            v_rms = 10 ** (power_dbm / 20) * math.sqrt(50)
-            v_mvrms = v_rms * 1000  # mV
+            self.__freq_list = freq_list_hz
+            self.__power_list = power_list
+            self.__freq_hz, self.__dbm, self.__rf_on = freq_list_hz[0], power_list[0], True
+            print(f"[리스트 설정] {len(freq_list_hz)} points")
+            return True
 
-            settings_dict = {"freq": freq, "dBm": power_dbm, "RMS": v_mvrms, "RF_ON": rf == '1'}
+        except Exception as e:
+            print(f"[오류 - 리스트 설정] {e}")
+            self.invalidate()
+            return False, e
 
-            print("[상태 확인]")
-            print(f' - 주파수     : {settings_dict["freq"]:.3e} Hz')
-            print(f' - 출력 전력  : {settings_dict["power_dbm"]:.2f} dBm')
-            print(f' - 전압 (RMS) : {settings_dict["RMS"]:.2f} mV')
-            print(f' - RF 출력    : {settings_dict["RF_ON"]}')
+    def list_index(self, index):
+        """
+        - Step the armed list to the given point
+        """
+        try:
+            self.__inst.write(f"SOUR:LIST:IND {index}")
+            self.__freq_hz, self.__dbm = self.__freq_list[index], self.__power_list[index]
+            print(f"[리스트 {index}] {self.__freq_hz} Hz, {self.__dbm} dBm")
+            return True
+
+        except Exception as e:
+            print(f"[오류 - 리스트 인덱스] {e}")
+            return False, e
 
-            return settings_dict
+    def abort_list(self):
+        """
+        - Leave list mode and return to a fixed (CW) frequency
+        """
+        try:
+            self.__inst.write("SOUR:FREQ:MODE CW")
+            # The CW frequency and power are not the last list point
+            self.__freq_hz = self.__dbm = None
+            print("[리스트 종료]")
+            return True
 
         except Exception as e:
-            print(f"[오류 - 상태 쿼리] {e}")
-            return  False, e
+            print(f"[오류 - 리스트 종료] {e}")
+            return False, e
+
+    def query_status(self, verbose=True):
+        """
+        - Return the current status(frequency, power, RMS voltage, RF state) as a GeneratorStatus
+        - Uses the open connection and a single compound query, so it is cheap enough to poll
+        """
+        state = self.refresh()
+        if state is None:
+            return None
+
+        freq, power_dbm, rf_on = state
+        # dBm → mV RMS 변환 (50Ω 기준)
+        v_mvrms = math.sqrt(10 ** (power_dbm / 10) * 1e-3 * 50) * 1000
+
+        status = GeneratorStatus(freq, power_dbm, v_mvrms, rf_on)
+
+        if verbose:
+            print("[상태 확인]")
+            print(f' - 주파수     : {status.freq:.3e} Hz')
+            print(f' - 출력 전력  : {status.dBm:.2f} dBm')
+            print(f' - 전압 (RMS) : {status.RMS:.2f} mV')
+            print(f' - RF 출력    : {status.RF_ON}')
+
+        return status
 
     def get_frequency(self):
         """
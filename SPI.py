@@ -1,84 +1,438 @@
-from cheetah_py import *
+from cheetah_backend import *
 import time
 import sys
 import os
-try:
-    from detect import port
-except:
-    print("Please Connect Cheetah")
+import threading
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+import json
+import detect
 from array import array
 import warnings
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-def read_register(read_address, read_data):
+# Status codes after which the adapter handle can no longer be trusted
+USB_ERRORS = (CH_COMMUNICATION_ERROR, CH_INVALID_HANDLE, CH_UNABLE_TO_OPEN, CH_OS_ERROR)
+
+# SPI bitrate used until an adapter has been calibrated (unit: kHz)
+DEFAULT_BITRATE_KHZ = 100
+# Highest verified bitrate per adapter unique ID (see register.calibrate_bitrate)
+BITRATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spi_bitrate.json")
+
+def load_bitrates():
     """
-    - Reads a specified number of 16-bit values
-      from a given SPI register address using the Cheetah device
+    - Return the calibrated bitrates as {unique_id: bitrate_khz}
     """
-    mode = 0
-    handle = ch_open(port)
+    try:
+        with open(BITRATE_FILE, "r", encoding="utf-8") as f:
+            return {int(uid): int(khz) for uid, khz in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+    except (ValueError, AttributeError) as e:
+        print(f"[SPI bitrate 파일 오류] {e}")
+        return {}
+
+def save_bitrate(unique_id, bitrate_khz):
+    """
+    - Store the calibrated bitrate of an adapter
+    """
+    bitrates = load_bitrates()
+    bitrates[int(unique_id)] = int(bitrate_khz)
+    with open(BITRATE_FILE, "w", encoding="utf-8") as f:
+        json.dump({str(uid): khz for uid, khz in sorted(bitrates.items())}, f, indent=2)
+
+class CheetahSession:
+    def __init__(self, port_number=None, bitrate_khz=None, mode=0):
+        """
+        - Initialize the class
+        - The adapter is opened on first use and stays open while the session is held
+        - Without bitrate_khz, the calibrated bitrate of the opened adapter is used
+          (DEFAULT_BITRATE_KHZ if it was never calibrated)
+        """
+        self.__port = port_number
+        self.__bitrate_khz = bitrate_khz
+        self.__fixed_bitrate = bitrate_khz is not None
+        self.__mode = mode
+        self.__handle = None
+        self.__applied = None
+        self.__refcount = 0
+        self.__buffers: dict[tuple[str, int], array] = {}
+        self.__lock = threading.RLock()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def acquire(self):
+        """
+        - Take a reference on the session
+        """
+        with self.__lock:
+            self.__refcount += 1
+
+    def release(self):
+        """
+        - Drop a reference on the session, closing the adapter when the last one is released
+        """
+        with self.__lock:
+            self.__refcount = max(0, self.__refcount - 1)
+            if self.__refcount == 0:
+                self.close()
+
+    def get_port(self):
+        """
+        - Return the port number the session opens, discovering the adapter on first use
+        """
+        return self.__port if self.__port is not None else detect.get_port()
+
+    def open(self):
+        """
+        - Open the adapter if it is not open yet and apply the cached SPI configuration
+        """
+        with self.__lock:
+            if self.__handle is None:
+                target = self.get_port()
+                if target is None:
+                    raise IOError("Please Connect Cheetah")
+
+                handle = ch_open(target)
+                if handle <= 0:
+                    raise IOError(f"Cheetah 열기 실패 (port {target}): {ch_status_string(handle)}")
+
+                self.__handle = handle
+                self.__applied = None
+                if not self.__fixed_bitrate:
+                    self.__bitrate_khz = load_bitrates().get(ch_unique_id(handle), DEFAULT_BITRATE_KHZ)
+                print("Opened Cheetah device on port %d" % target)
+
+            self.configure()
+            return self.__handle
 
-    print("Opened Cheetah device on port %d" % port)
+    def close(self):
+        """
+        - Close the adapter handle
+        """
+        with self.__lock:
+            if self.__handle is not None:
+                ch_close(self.__handle)
+                self.__handle = None
+                self.__applied = None
 
-    ch_spi_bitrate(handle, 100)
-    ch_spi_configure(handle, (mode >> 1), mode & 1, CH_SPI_BITORDER_MSB, 0x0)
-    ch_spi_queue_oe(handle, 1)
-    ch_spi_queue_clear(handle)
-    ch_spi_queue_ss(handle, 1)
+    def configure(self, bitrate_khz=None, mode=None):
+        """
+        - Set the SPI bitrate(unit: kHz) and mode, sending them only when they changed
+        """
+        with self.__lock:
+            if bitrate_khz is not None:
+                self.__bitrate_khz = bitrate_khz
+                self.__fixed_bitrate = True
+            if mode is not None:
+                self.__mode = mode
 
-    read_cmd_address = int(128 + read_address)
+            if self.__handle is None or self.__applied == (self.__bitrate_khz, self.__mode):
+                return
 
-    MOSI_cmd_address = array('B', [0])
-    MOSI_cmd_address[0] = read_cmd_address & 0xff
-    MISO_data = array('B', [0] * read_data * 2)
+            # The adapter rounds to the nearest rate it supports
+            actual = ch_spi_bitrate(self.__handle, self.__bitrate_khz)
+            if actual > 0:
+                self.__bitrate_khz = actual
+            ch_spi_configure(self.__handle, (self.__mode >> 1), self.__mode & 1, CH_SPI_BITORDER_MSB, 0x0)
+            self.__applied = (self.__bitrate_khz, self.__mode)
+
+    def bitrate(self):
+        """
+        - Return the SPI bitrate(unit: kHz) of the session
+        """
+        return self.__bitrate_khz if self.__bitrate_khz is not None else DEFAULT_BITRATE_KHZ
+
+    def unique_id(self):
+        """
+        - Return the unique ID of the adapter, opening it if needed
+        """
+        with self.__lock:
+            return ch_unique_id(self.open())
+
+    def buffer(self, name, size):
+        """
+        - Return a reusable zero-initialised byte buffer owned by the session
+        - Buffers are only safe to use while the session lock is held
+        """
+        with self.__lock:
+            buf = self.__buffers.get((name, size))
+            if buf is None:
+                buf = self.__buffers[(name, size)] = array('B', bytes(size))
+            return buf
+
+    def transact(self, func):
+        """
+        - Run func(handle) under the session lock
+        - Reopen the adapter and retry once when func reports a USB error
+        """
+        with self.__lock:
+            for attempt in range(2):
+                result = func(self.open())
+                status = result[0] if isinstance(result, tuple) else result
+                if attempt or not (isinstance(status, int) and status in USB_ERRORS):
+                    return result
+
+                print(f"[Cheetah 재연결] {ch_status_string(status)}")
+                self.close()
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    - Return the process-wide Cheetah session shared by the GUI and the measurement engine
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = CheetahSession()
+        return _session
+
+def decode_words(data, count=-1, out=None):
+    """
+    - Interpret register bytes (MSB first) as 16-bit words through a memoryview,
+      copying them into out (or a new uint16 array)
+    """
+    words = np.frombuffer(memoryview(data), dtype='>u2', count=count)
+    if out is None:
+        return words.astype(np.uint16)
+    out[:len(words)] = words
+    return out
+
+def _read_into(session, read_address, read_data, consume):
+    """
+    - Shift a register read into the session's reusable buffers and return consume(data_in)
+    - consume runs under the session lock, before the buffers can be reused
+    """
+    def shift(handle):
+        MOSI_cmd_address = session.buffer("read_cmd", 1)
+        MOSI_cmd_address[0] = int(128 + read_address) & 0xff
+        MISO_cmd = session.buffer("read_cmd_in", 1)
+        # Dummy bytes clocked out while reading; this buffer is never written to
+        MISO_data = session.buffer("read_zeros", read_data * 2)
+        data_in = session.buffer("read_in", read_data * 2)
 
-    ch_spi_queue_array(handle, MOSI_cmd_address)
-    ch_spi_batch_shift(handle, len(MOSI_cmd_address))
+        ch_spi_queue_oe(handle, 1)
+        ch_spi_queue_clear(handle)
+        ch_spi_queue_ss(handle, 1)
 
-    ch_spi_queue_array(handle, MISO_data)
-    result, data_in = ch_spi_batch_shift(handle, len(MISO_data))
+        ch_spi_queue_array(handle, MOSI_cmd_address)
+        ch_spi_batch_shift(handle, MISO_cmd)
+
+        ch_spi_queue_array(handle, MISO_data)
+        result, _ = ch_spi_batch_shift(handle, data_in)
+        ch_spi_queue_ss(handle, 0)
+
+        if result < 0:
+            return result, None
+        return result, consume(data_in)
+
+    with session:
+        result, value = session.transact(shift)
 
     if result < 0:
         print(f"SPI Read Error: {result}")
-        ch_spi_queue_ss(handle, 0)
         return None
-    ch_spi_queue_ss(handle, 0)
-    ch_close(port)
-    return data_in
+    return value
+
+def read_register(read_address, read_data, session=None):
+    """
+    - Reads a specified number of 16-bit values
+      from a given SPI register address using the Cheetah device
+    - Returns a copy of the received bytes, since the session buffer is reused;
+      use read_words with out for a copy-free readback
+    """
+    return _read_into(session or get_session(), read_address, read_data, lambda data_in: array('B', data_in))
+
+def read_words(read_address, read_data, session=None, out=None):
+    """
+    - Reads a specified number of 16-bit values and returns them as a uint16 array
+    """
+    return _read_into(session or get_session(), read_address, read_data,
+                      lambda data_in: decode_words(data_in, read_data, out))
 
-def keti_spi_write(handle, write_address, write_data):
+def write_registers(reg_values: dict[int, int], session=None):
     """
-    - Writes a 16-bit value to a specified SPI register address using the Cheetah device
+    - Writes several 16-bit register values in a single Cheetah batch
+    - Each register is queued as its own 3-byte frame with SS toggled around it,
+      then the whole batch is shifted in one USB round trip
     """
-    data_1 = (write_data >> 8)
-    data_0 = (write_data & 0b11111111)
-    
-    data_out_0 = int(write_address)
-    data_out_1 = int(data_1)
-    data_out_2 = int(data_0)
+    session = session or get_session()
+
+    frames = [array('B', [int(address) & 0xff, (int(value) >> 8) & 0xff, int(value) & 0xff])
+              for address, value in reg_values.items()]
+    data_in = array('B', [0] * 3 * len(frames))
 
-    ch_spi_queue_oe(handle, 1)
-    ch_spi_queue_clear(handle)
-    data_out = array('B', [0 for i in range(3)])
-    data_out[0] = data_out_0 & 0xff
-    data_out[1] = data_out_1 & 0xff
-    data_out[2] = data_out_2 & 0xff
+    def shift(handle):
+        ch_spi_queue_oe(handle, 1)
+        ch_spi_queue_clear(handle)
+        for frame in frames:
+            ch_spi_queue_ss(handle, 0x1)
+            ch_spi_queue_array(handle, frame)
+            ch_spi_queue_ss(handle, 0)
+        result, _ = ch_spi_batch_shift(handle, data_in)
+        return result
 
-    ch_spi_queue_ss(handle, 0x1)
-    ch_spi_queue_array(handle, data_out)
-    ch_spi_queue_ss(handle, 0)
-    ch_spi_async_submit(handle)
+    if not reg_values:
+        return 0
 
+    with session:
+        result = session.transact(shift)
+
+    if result < 0:
+        print(f"SPI Write Error: {result}")
+    return result
 
-def write_register(address, hex_str):
+def write_register(address, hex_str, session=None):
     """
-    - Opens the Cheetah device and writes a hexadecimal string value to a specific register via SPI
+    - Writes a hexadecimal string value to a specific register via SPI
     """
-    mode = 0
-    handle = ch_open(port)
-    print("Opened Cheetah device on port %d" % port)
-    ch_spi_bitrate(handle, 100)
-    data = int(hex_str, 16)
-    keti_spi_write(handle, address, data)
-    ch_close(port)
\ No newline at end of file
+    return write_registers({address: int(hex_str, 16)}, session)
+
+class AsyncSPI:
+    def __init__(self, session=None, depth=4):
+        """
+        - Initialize the class
+        - Keeps up to depth batches in flight with ch_spi_async_submit and collects
+          them in submission order with ch_spi_async_collect
+        """
+        self.__session = session or get_session()
+        self.__depth = depth
+        self.__pending = deque()
+        self.__read_frames: dict[tuple[int, int], array] = {}
+
+    def __enter__(self):
+        self.__session.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        finally:
+            self.__session.release()
+        return False
+
+    def __collect(self, handle):
+        """
+        - Collect the oldest batch in flight and resolve its future
+        """
+        future, rx_len, decode = self.__pending.popleft()
+        # decode copies out of the buffer, so one buffer per size serves every batch
+        result, data_in = ch_spi_async_collect(handle, self.__session.buffer("async_in", rx_len))
+        if result < 0:
+            future.set_exception(IOError(f"SPI 비동기 수집 실패: {ch_status_string(result)}"))
+            if result in USB_ERRORS:
+                self.__fail_pending(result)
+        else:
+            future.set_result(decode(data_in))
+        return result
+
+    def __fail_pending(self, status):
+        """
+        - Fail every batch in flight, used when the adapter handle is lost
+        """
+        while self.__pending:
+            future, _, _ = self.__pending.popleft()
+            future.set_exception(IOError(f"SPI 연결 끊김: {ch_status_string(status)}"))
+
+    def submit(self, frames, rx_len, decode=lambda data: data):
+        """
+        - Queue each frame with SS toggled around it into one batch and submit it asynchronously
+        - Blocks only when depth batches are already in flight, collecting the oldest one first
+        - Return a Future resolved with decode(received bytes) when the batch is collected
+        """
+        future = Future()
+
+        def submit_batch(handle):
+            while len(self.__pending) >= self.__depth:
+                self.__collect(handle)
+
+            ch_spi_queue_oe(handle, 1)
+            ch_spi_queue_clear(handle)
+            for frame in frames:
+                ch_spi_queue_ss(handle, 0x1)
+                ch_spi_queue_array(handle, frame)
+                ch_spi_queue_ss(handle, 0)
+            result = ch_spi_async_submit(handle)
+            if result >= 0:
+                self.__pending.append((future, rx_len, decode))
+            elif result in USB_ERRORS:
+                self.__fail_pending(result)
+            return result
+
+        with self.__session:
+            result = self.__session.transact(submit_batch)
+        if result < 0:
+            future.set_exception(IOError(f"SPI 비동기 전송 실패: {ch_status_string(result)}"))
+        return future
+
+    def collect(self):
+        """
+        - Collect the oldest batch in flight, return False if nothing is pending
+        """
+        with self.__session:
+            result = self.__session.transact(lambda handle: self.__collect(handle) if self.__pending else None)
+        return result is not None
+
+    def wait(self, future):
+        """
+        - Collect batches until the given future is resolved and return its result
+        """
+        while not future.done() and self.collect():
+            pass
+        return future.result()
+
+    def flush(self):
+        """
+        - Collect every batch in flight
+        """
+        while self.collect():
+            pass
+
+    def write(self, reg_values: dict[int, int]):
+        """
+        - Submit a register write batch, return a Future of the number of bytes shifted
+          (a failed batch resolves the Future with an IOError instead)
+        """
+        frames = [array('B', [int(address) & 0xff, (int(value) >> 8) & 0xff, int(value) & 0xff])
+                  for address, value in reg_values.items()]
+        return self.submit(frames, 3 * len(frames), lambda data: len(data))
+
+    def read(self, read_address, read_data, out=None):
+        """
+        - Submit a register read batch, return a Future of the register values as a uint16 array
+        - The command byte and the dummy bytes share one SS window; as in read_register,
+          the bytes clocked in from the command byte onward are decoded
+        - With out, the values are decoded into it when the batch is collected and no
+          array is allocated per read (the read frame is built once per address and length)
+        """
+        key = (read_address, read_data)
+        frame = self.__read_frames.get(key)
+        if frame is None:
+            frame = self.__read_frames[key] = array('B', [int(128 + read_address) & 0xff] + [0] * read_data * 2)
+        return self.submit([frame], len(frame), lambda data: decode_words(data, read_data, out))
+
+    async def write_async(self, reg_values: dict[int, int]):
+        """
+        - Awaitable version of write()
+        """
+        future = self.write(reg_values)
+        return await asyncio.get_running_loop().run_in_executor(None, self.wait, future)
+
+    async def read_async(self, read_address, read_data):
+        """
+        - Awaitable version of read()
+        """
+        future = self.read(read_address, read_data)
+        return await asyncio.get_running_loop().run_in_executor(None, self.wait, future)
@@ -0,0 +1,11 @@
+"""
+- Select the Cheetah API implementation
+- CHEETAH_BACKEND=sim uses the software model in cheetah_sim.py, anything else the
+  Total Phase binding in cheetah_py.py
+"""
+import os
+
+if os.environ.get("CHEETAH_BACKEND", "").lower() == "sim":
+    from cheetah_sim import *
+else:
+    from cheetah_py import *
@@ -0,0 +1,388 @@
+"""
+- Software model of a Cheetah SPI host adapter with the same ch_* surface as cheetah_py
+- Select it with CHEETAH_BACKEND=sim (see cheetah_backend.py)
+"""
+import os
+import time
+import threading
+from array import array, ArrayType
+from collections import deque
+
+#==========================================================================
+# STATUS CODES / CONSTANTS (same values as cheetah_py)
+#==========================================================================
+CH_OK                      =    0
+CH_UNABLE_TO_LOAD_LIBRARY  =   -1
+CH_UNABLE_TO_LOAD_DRIVER   =   -2
+CH_UNABLE_TO_LOAD_FUNCTION =   -3
+CH_INCOMPATIBLE_LIBRARY    =   -4
+CH_INCOMPATIBLE_DEVICE     =   -5
+CH_INCOMPATIBLE_DRIVER     =   -6
+CH_COMMUNICATION_ERROR     =   -7
+CH_UNABLE_TO_OPEN          =   -8
+CH_UNABLE_TO_CLOSE         =   -9
+CH_INVALID_HANDLE          =  -10
+CH_CONFIG_ERROR            =  -11
+CH_UNKNOWN_PROTOCOL        =  -12
+CH_STILL_ACTIVE            =  -13
+CH_FUNCTION_NOT_AVAILABLE  =  -14
+CH_OS_ERROR                =  -15
+
+CH_SPI_WRITE_ERROR         = -100
+CH_SPI_BATCH_EMPTY_QUEUE   = -101
+CH_SPI_BATCH_SHORT_BUFFER  = -102
+CH_SPI_ASYNC_EMPTY         = -103
+CH_SPI_ASYNC_PENDING       = -104
+CH_SPI_ASYNC_MAX_REACHED   = -105
+CH_SPI_ASYNC_EXCESS_DELAY  = -106
+
+CH_PORT_NOT_FREE = 0x8000
+
+CH_SPI_POL_RISING_FALLING = 0
+CH_SPI_POL_FALLING_RISING = 1
+CH_SPI_PHASE_SAMPLE_SETUP = 0
+CH_SPI_PHASE_SETUP_SAMPLE = 1
+CH_SPI_BITORDER_MSB = 0
+CH_SPI_BITORDER_LSB = 1
+
+CH_TARGET_POWER_OFF = 0x00
+CH_TARGET_POWER_ON = 0x01
+CH_TARGET_POWER_QUERY = 0x80
+
+CH_LIBRARY_LOADED = True
+
+_STATUS_STRINGS = {
+    CH_OK: "ok",
+    CH_COMMUNICATION_ERROR: "communication error",
+    CH_UNABLE_TO_OPEN: "unable to open",
+    CH_INVALID_HANDLE: "invalid handle",
+    CH_CONFIG_ERROR: "configuration error",
+    CH_SPI_BATCH_EMPTY_QUEUE: "batch queue empty",
+    CH_SPI_ASYNC_EMPTY: "no async batch pending",
+    CH_SPI_ASYNC_MAX_REACHED: "too many async batches",
+}
+
+# Slowest and fastest SPI bitrate of the adapter (unit: kHz)
+MIN_BITRATE_KHZ = 100
+MAX_BITRATE_KHZ = 40000
+# Maximum number of asynchronous batches the adapter accepts
+MAX_ASYNC = 16
+
+def array_u08(n):  return array('B', [0]*n)
+def array_u16(n):  return array('H', [0]*n)
+def array_u32(n):  return array('I', [0]*n)
+
+
+class SimCheetah:
+    def __init__(self, port=0, unique_id=1364000001, register_count=20, reset_values=None,
+                 latency_s=250e-6, open_latency_s=50e-3, realtime=False, max_reliable_khz=None):
+        """
+        - Initialize the class
+        - latency_s is the USB round trip of one batch, open_latency_s the cost of ch_open
+        - Above max_reliable_khz MISO is sampled wrong: bit 0 of every byte read back flips
+          (writes reach the register file intact)
+        - Time is kept on a simulated clock; with realtime the model also sleeps
+        """
+        self.port = port
+        self.unique_id = unique_id
+        self.registers = [0] * register_count
+        for addr, value in (reset_values or {0: 0x7719, 1: 0x0087, 15: 0x0004}).items():
+            self.registers[addr] = value
+        self.latency_s = latency_s
+        self.open_latency_s = open_latency_s
+        self.realtime = realtime
+        self.max_reliable_khz = max_reliable_khz
+
+        self.handle = None
+        self.bitrate_khz = 1000
+        self.queue = []
+        self.inflight = deque()
+
+        # Simulated host clock and the time the SPI bus becomes idle
+        self.clock = 0.0
+        self.busy_until = 0.0
+
+        # Counters for throughput measurements
+        self.stats = {"opens": 0, "shifts": 0, "async_batches": 0, "bytes": 0}
+
+    def advance(self, t):
+        """
+        - Move the simulated host clock forward to t
+        """
+        if t > self.clock:
+            if self.realtime:
+                time.sleep(t - self.clock)
+            self.clock = t
+
+    def transfer_time(self, n_bytes):
+        """
+        - Return the time needed to clock n_bytes at the current bitrate
+        """
+        return n_bytes * 8 / (self.bitrate_khz * 1e3)
+
+    def run_batch(self):
+        """
+        - Execute the queued batch against the register model and return the MISO bytes
+        - A frame starts when SS is asserted; a first byte with bit 7 set is a read command,
+          which (as the host code expects) streams the register file from register 0, MSB first.
+          Any other 3-byte frame writes a 16-bit value to the addressed register
+        """
+        miso = array('B')
+        frame = []
+        read_stream = None
+        noise = 0x01 if self.max_reliable_khz and self.bitrate_khz > self.max_reliable_khz else 0x00
+
+        def end_frame():
+            if len(frame) == 3 and not frame[0] & 0x80 and frame[0] < len(self.registers):
+                self.registers[frame[0]] = (frame[1] << 8) | frame[2]
+            frame.clear()
+
+        for op in self.queue:
+            if op[0] == "ss":
+                end_frame()
+                read_stream = None
+            elif op[0] == "data":
+                for byte in op[1]:
+                    if not frame and byte & 0x80:
+                        read_stream = [b for reg in self.registers for b in (reg >> 8, reg & 0xff)]
+                    frame.append(byte)
+                    if read_stream is not None:
+                        pos = len(frame) - 1
+                        miso.append((read_stream[pos] ^ noise) if pos < len(read_stream) else 0)
+                    else:
+                        miso.append(0)
+        end_frame()
+
+        self.stats["bytes"] += len(miso)
+        return miso
+
+
+_devices: dict[int, SimCheetah] = {0: SimCheetah()}
+_handles: dict[int, SimCheetah] = {}
+_lock = threading.RLock()
+
+def sim_device(port=0):
+    """
+    - Return the simulated adapter on the given port
+    """
+    return _devices[port]
+
+def sim_reset(*devices):
+    """
+    - Replace the simulated adapters (default: one adapter on port 0)
+    """
+    with _lock:
+        _devices.clear()
+        _handles.clear()
+        for dev in devices or (SimCheetah(),):
+            _devices[dev.port] = dev
+
+def _device(cheetah):
+    return _handles.get(cheetah)
+
+def _out_array(data_in):
+    if isinstance(data_in, int):
+        return array_u08(data_in), data_in
+    if isinstance(data_in, ArrayType):
+        return data_in, len(data_in)
+    return data_in[0], min(len(data_in[0]), int(data_in[1]))
+
+def _fill(data_in, miso):
+    (buf, num_bytes) = _out_array(data_in)
+    n = min(num_bytes, len(miso))
+    buf[:n] = miso[:n]
+    if isinstance(data_in, int):
+        del buf[n:]
+    return buf
+
+
+#==========================================================================
+# GENERAL API
+#==========================================================================
+def ch_find_devices(devices):
+    with _lock:
+        ports = array('H', [(dev.port | (CH_PORT_NOT_FREE if dev.handle else 0)) for dev in _devices.values()])
+    return (len(ports), ports)
+
+def ch_find_devices_ext(devices, unique_ids):
+    with _lock:
+        ports = array('H', [(dev.port | (CH_PORT_NOT_FREE if dev.handle else 0)) for dev in _devices.values()])
+        ids = array('I', [dev.unique_id for dev in _devices.values()])
+    return (len(ports), ports, ids)
+
+def ch_open(port_number):
+    with _lock:
+        dev = _devices.get(port_number)
+        if dev is None or dev.handle is not None:
+            return CH_UNABLE_TO_OPEN
+        dev.advance(dev.clock + dev.open_latency_s)
+        dev.handle = port_number + 1
+        dev.queue = []
+        dev.inflight.clear()
+        dev.stats["opens"] += 1
+        _handles[dev.handle] = dev
+        return dev.handle
+
+def ch_close(cheetah):
+    with _lock:
+        dev = _handles.pop(cheetah, None)
+        if dev is None:
+            return CH_INVALID_HANDLE
+        dev.handle = None
+        return CH_OK
+
+def ch_port(cheetah):
+    dev = _device(cheetah)
+    return dev.port if dev else CH_INVALID_HANDLE
+
+def ch_unique_id(cheetah):
+    dev = _device(cheetah)
+    return dev.unique_id if dev else 0
+
+def ch_status_string(status):
+    return _STATUS_STRINGS.get(status, "status %d" % status)
+
+def ch_sleep_ms(milliseconds):
+    time.sleep(milliseconds / 1000)
+    return milliseconds
+
+def ch_target_power(cheetah, power_flag):
+    return CH_OK if _device(cheetah) else CH_INVALID_HANDLE
+
+
+#==========================================================================
+# SPI API
+#==========================================================================
+def ch_spi_bitrate(cheetah, bitrate_khz):
+    dev = _device(cheetah)
+    if dev is None:
+        return CH_INVALID_HANDLE
+    dev.bitrate_khz = min(max(int(bitrate_khz), MIN_BITRATE_KHZ), MAX_BITRATE_KHZ)
+    return dev.bitrate_khz
+
+def ch_spi_configure(cheetah, polarity, phase, bitorder, ss_polarity):
+    return CH_OK if _device(cheetah) else CH_INVALID_HANDLE
+
+def ch_spi_queue_clear(cheetah):
+    dev = _device(cheetah)
+    if dev is None:
+        return CH_INVALID_HANDLE
+    dev.queue = []
+    return CH_OK
+
+def ch_spi_queue_oe(cheetah, oe):
+    dev = _device(cheetah)
+    if dev is None:
+        return CH_INVALID_HANDLE
+    dev.queue.append(("oe", oe))
+    return CH_OK
+
+def ch_spi_queue_delay_cycles(cheetah, cycles):
+    return cycles if _device(cheetah) else CH_INVALID_HANDLE
+
+def ch_spi_queue_delay_ns(cheetah, nanoseconds):
+    return nanoseconds if _device(cheetah) else CH_INVALID_HANDLE
+
+def ch_spi_queue_ss(cheetah, active):
+    dev = _device(cheetah)
+    if dev is None:
+        return CH_INVALID_HANDLE
+    dev.queue.append(("ss", active))
+    return CH_OK
+
+def ch_spi_queue_byte(cheetah, count, data):
+    dev = _device(cheetah)
+    if dev is None:
+        return CH_INVALID_HANDLE
+    dev.queue.append(("data", bytes([data & 0xff]) * count))
+    return CH_OK
+
+def ch_spi_queue_array(cheetah, data_out):
+    dev = _device(cheetah)
+    if dev is None:
+        return CH_INVALID_HANDLE
+    (data_out, num_bytes) = _out_array(data_out)
+    if data_out.typecode != 'B':
+        raise TypeError("type for 'data_out' must be array('B')")
+    dev.queue.append(("data", bytes(data_out[:num_bytes])))
+    return num_bytes
+
+def ch_spi_batch_length(cheetah):
+    dev = _device(cheetah)
+    if dev is None:
+        return CH_INVALID_HANDLE
+    return sum(len(op[1]) for op in dev.queue if op[0] == "data")
+
+def ch_spi_batch_shift(cheetah, data_in):
+    with _lock:
+        dev = _device(cheetah)
+        if dev is None:
+            return (CH_INVALID_HANDLE, _out_array(data_in)[0])
+        if not dev.queue:
+            return (CH_SPI_BATCH_EMPTY_QUEUE, _out_array(data_in)[0])
+
+        miso = dev.run_batch()
+        start = max(dev.clock, dev.busy_until)
+        dev.busy_until = start + dev.transfer_time(len(miso))
+        dev.advance(dev.busy_until + dev.latency_s)
+        dev.stats["shifts"] += 1
+        return (len(miso), _fill(data_in, miso))
+
+def ch_spi_async_submit(cheetah):
+    with _lock:
+        dev = _device(cheetah)
+        if dev is None:
+            return CH_INVALID_HANDLE
+        if not dev.queue:
+            return CH_SPI_BATCH_EMPTY_QUEUE
+        if len(dev.inflight) >= MAX_ASYNC:
+            return CH_SPI_ASYNC_MAX_REACHED
+
+        # The bus works through submitted batches back to back; only the
+        # result has to travel back over USB
+        miso = dev.run_batch()
+        start = max(dev.clock, dev.busy_until)
+        dev.busy_until = start + dev.transfer_time(len(miso))
+        dev.inflight.append((dev.busy_until + dev.latency_s, miso))
+        dev.stats["async_batches"] += 1
+        return CH_OK
+
+def ch_spi_async_collect(cheetah, data_in):
+    with _lock:
+        dev = _device(cheetah)
+        if dev is None:
+            return (CH_INVALID_HANDLE, _out_array(data_in)[0])
+        if not dev.inflight:
+            return (CH_SPI_ASYNC_EMPTY, _out_array(data_in)[0])
+
+        ready, miso = dev.inflight.popleft()
+        dev.advance(ready)
+        return (len(miso), _fill(data_in, miso))
+
+
+if __name__ == "__main__":
+    # Register programming throughput on the simulated adapter
+    os.environ["CHEETAH_BACKEND"] = "sim"
+    import cheetah_sim
+    import detect
+    from SPI import get_session, write_register, write_registers, read_words
+    from register import RegisterShadow, encode
+
+    detect.pin(port=0)
+    # The backend imports this file as cheetah_sim, not __main__
+    dev = cheetah_sim.sim_device(0)
+    kp_ki = encode(0, kp=[[kp] for kp in range(16)], ki=[list(range(4))]).ravel()
+
+    def run(label, func):
+        start_clock, start_stats = dev.clock, dict(dev.stats)
+        func()
+        stats = {k: v - start_stats[k] for k, v in dev.stats.items()}
+        print(f"{label:<32} {dev.clock - start_clock:8.4f} s (simulated)  {stats}")
+
+    run("write_register, no session", lambda: [write_register(0, f"{int(w):04X}") for w in kp_ki])
+    with get_session():
+        run("write_register, shared session", lambda: [write_register(0, f"{int(w):04X}") for w in kp_ki])
+        run("write_registers (0, 1, 15)", lambda: [write_registers({0: int(w), 1: 0x87, 15: 4}) for w in kp_ki])
+        run("write + read_words", lambda: [(write_registers({0: int(w)}), read_words(2, 20)) for w in kp_ki])
+        shadow = RegisterShadow()
+        run("RegisterShadow, verify", lambda: [shadow.write({0: int(w), 1: 0x87}, verify=True) for w in kp_ki])
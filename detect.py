@@ -28,34 +28,95 @@
 # IMPORTS
 #==========================================================================
 from __future__ import division, with_statement, print_function
-from cheetah_py import *
+import os
+import threading
+from cheetah_backend import *
 
 
 #==========================================================================
-# MAIN PROGRAM
+# DEVICE DISCOVERY
 #==========================================================================
-print("Searching for Cheetah adapters...")
+# Discovery runs on first use only and is cached for the process lifetime.
+# A port or unique ID can be pinned (or set through the CHEETAH_PORT /
+# CHEETAH_UNIQUE_ID environment variables); a pinned port skips USB
+# enumeration entirely.
+_devices = None
+_pinned_port = None
+_pinned_unique_id = None
+_lock = threading.Lock()
+
+def pin(port=None, unique_id=None):
+    """
+    - Pin the adapter to use by port number or by unique ID
+    """
+    global _pinned_port, _pinned_unique_id
+
+    with _lock:
+        _pinned_port = port
+        _pinned_unique_id = unique_id
+
+def find_devices(refresh=False):
+    """
+    - Return the attached adapters as a list of (port, unique_id, in_use) tuples
+    - The USB scan runs once and is cached unless refresh is set
+    """
+    global _devices
+
+    with _lock:
+        if _devices is None or refresh:
+            (num, ports, unique_ids) = ch_find_devices_ext(16, 16)
+            _devices = []
+            # num counts every adapter found, even beyond the 16 entries returned
+            for i in range(min(num, len(ports))):
+                port = ports[i]
+                _devices.append((port & ~CH_PORT_NOT_FREE, unique_ids[i],
+                                 bool(port & CH_PORT_NOT_FREE)))
+        return list(_devices)
+
+def get_port():
+    """
+    - Return the port of the adapter to use, or None if no adapter is found
+    - Order: pinned port, pinned unique ID, first free adapter
+    """
+    port = _pinned_port
+    if port is None and os.environ.get("CHEETAH_PORT"):
+        port = int(os.environ["CHEETAH_PORT"])
+    if port is not None:
+        return port
 
-# Find all the attached devices
-(num, ports, unique_ids) = ch_find_devices_ext(16, 16)
+    unique_id = _pinned_unique_id
+    if unique_id is None and os.environ.get("CHEETAH_UNIQUE_ID"):
+        unique_id = int(os.environ["CHEETAH_UNIQUE_ID"].replace("-", ""))
+
+    devices = find_devices()
+    if unique_id is not None:
+        devices = [dev for dev in devices if dev[1] == unique_id]
+    for port, _, in_use in devices:
+        if not in_use:
+            return port
+    return devices[0][0] if devices else None
+
+
+#==========================================================================
+# MAIN PROGRAM
+#==========================================================================
+if __name__ == "__main__":
+    print("Searching for Cheetah adapters...")
 
-if num > 0:
-    print("%d device(s) found:" % num)
+    # Find all the attached devices
+    devices = find_devices()
 
-    # Print the information on each device
-    for i in range(num):
-        port      = ports[i]
-        unique_id = unique_ids[i]
+    if len(devices) > 0:
+        print("%d device(s) found:" % len(devices))
 
-        # Determine if the device is in-use
-        inuse = "(avail)"
-        if (port & CH_PORT_NOT_FREE):
-            inuse = "(in-use)"
-            port  = port & ~CH_PORT_NOT_FREE
+        # Print the information on each device
+        for (port, unique_id, in_use) in devices:
+            # Determine if the device is in-use
+            inuse = "(in-use)" if in_use else "(avail)"
 
-        # Display device port number, in-use status, and serial number
-        print("    port = %d   %s  (%04d-%06d)" %
-              (port, inuse, unique_id // 1000000, unique_id % 1000000))
+            # Display device port number, in-use status, and serial number
+            print("    port = %d   %s  (%04d-%06d)" %
+                  (port, inuse, unique_id // 1000000, unique_id % 1000000))
 
-else:
-    print("No devices found.")
+    else:
+        print("No devices found.")
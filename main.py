@@ -1,15 +1,23 @@
+import time
 import tkinter as tk
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from tkinter.ttk import Notebook, Label, Button, Frame, Entry, LabelFrame, Checkbutton, Progressbar, Combobox, Treeview
 from tkinter import StringVar, DoubleVar, BooleanVar, IntVar, Radiobutton
 
-from util import set_label_text, check_ip, toggle_frame, change_freq_unit, bin16_to_hex4
+from util import set_label_text, check_ip, toggle_frame, change_freq_unit
 
 from E36313A import E36313A
 from SMB100B import SMB100B
 from FSV3000 import FSV3000
 from measurement import measurement
 
-from SPI import write_register, read_register
+from SPI import write_register, write_registers, read_words, get_session
+from register import REGISTER_MAP, encode, decode
+
+# Time after which a device that has not answered is reported as late (unit: s);
+# polling continues at a slower rate, so its result is still shown when it arrives
+CONNECT_TIMEOUT_S = 10.0
 
 class Application:
     def __init__(self):
@@ -23,17 +31,17 @@ class Application:
             "FSV3000":      StringVar(value = "192.168.0.6"),
         }
 
-        # Register settings and default values
-        self.reg_settings = {
-            0: ("0111011100011001", {
-                4: IntVar(value=1), 6: IntVar(value=0)}),
-            1: ("0000000010000111", {}),
-            15: ("0000000000000100", {
-                0: IntVar(value=0), 1: IntVar(value=0),
-                10: IntVar(value=0), 11: IntVar(value=0),
-                12: IntVar(value=0), 13: IntVar(value=0),
-            })
+        # Register settings, defaulting to the reset values of the register map
+        self.reg_settings: dict[int, dict[str, IntVar]] = {
+            0: {"en_dsm": IntVar(), "dlf_mode": IntVar()},
+            1: {},
+            15: {"pll_mode": IntVar(), "bbpd_off": IntVar(), "retime": IntVar(),
+                 "inversion": IntVar(), "div_ratio": IntVar(), "clk_src": IntVar()},
         }
+        for reg_addr, field_vars in self.reg_settings.items():
+            reset_fields = decode(reg_addr, REGISTER_MAP[reg_addr].reset)
+            for name, var in field_vars.items():
+                var.set(int(reset_fields[name]))
 
         # kp_dco parameter variables
         self.__var_kp = {
@@ -113,6 +121,11 @@ class Application:
         self.__sgu = SMB100B()
         self.__sau = FSV3000()
 
+        # Shared Cheetah session, held open while the GUI is running
+        self.__spi = get_session()
+        # Reusable buffer for register readback
+        self.__reg_words = np.zeros(20, dtype=np.uint16)
+
     def tab_connection(self, notebook: Notebook) -> None:
         """
         - Create the "Device Connection" tab
@@ -156,29 +169,45 @@ class Application:
 
     def connect_all(self, label_info: Label):
         """
-        - Set IP addresses for all devices
+        - Set IP addresses for all devices and connect them in parallel
+        - label_info is updated from the Tk thread as each device answers
         """
         self.__psu1.set_ip(self.__device_ip["E36313A - 1"].get())
         self.__psu2.set_ip(self.__device_ip["E36313A - 2"].get())
         self.__sgu.set_ip(self.__device_ip["SMB100B"].get())
         self.__sau.set_ip(self.__device_ip["FSV3000"].get())
 
-        # Connect each device and record connection status
-        self.connection_state = []
-        self.connection_state.append(self.__psu1.connect_device())
-        self.connection_state.append(self.__psu2.connect_device())
-        self.connection_state.append(self.__sgu.connect_device())
-        self.connection_state.append(self.__sau.connect_device())
-
-        # Log connection results
-        log_connect_state: list[str] = []
-        for idx, state in enumerate(self.connection_state):
-            if state:
-                log_connect_state.append(f"{list(self.__device_ip.keys())[idx]} 연결 성공")
-            else:
-                log_connect_state.append(f"{list(self.__device_ip.keys())[idx]} 연결 실패")
-
-        set_label_text(label_info, "\n".join(log_connect_state))
+        devices = [self.__psu1, self.__psu2, self.__sgu, self.__sau]
+        names = list(self.__device_ip.keys())
+
+        # Connect each device on its own worker thread
+        executor = ThreadPoolExecutor(max_workers=len(devices))
+        futures = [executor.submit(device.connect_device) for device in devices]
+        executor.shutdown(wait=False)
+
+        self.connection_state = [False] * len(devices)
+        deadline = time.monotonic() + CONNECT_TIMEOUT_S
+
+        def poll():
+            # Runs on the Tk thread; worker threads never touch the widgets
+            log_connect_state = []
+            pending = False
+            for idx, future in enumerate(futures):
+                if future.done():
+                    self.connection_state[idx] = future.exception() is None and future.result() is True
+                    log_connect_state.append(f"{names[idx]} 연결 {'성공' if self.connection_state[idx] else '실패'}")
+                elif time.monotonic() > deadline:
+                    pending = True
+                    log_connect_state.append(f"{names[idx]} 응답 없음 (시간 초과, 계속 대기)")
+                else:
+                    pending = True
+                    log_connect_state.append(f"{names[idx]} 연결 중...")
+            set_label_text(label_info, "\n".join(log_connect_state))
+
+            if pending:
+                label_info.after(50 if time.monotonic() <= deadline else 500, poll)
+
+        poll()
 
     def tab_spi(self, notebook: Notebook) -> None:
         """
@@ -192,23 +221,23 @@ class Application:
 
         # SPI mode options and their settings
         mode_options = [
-            ("Enable DSM", 0, [("Enable", 4, 1), ("Disable", 4, 0)]),
-            ("DLF Mode", 0, [("DLF update", 6, 0), ("Free running", 6, 1)]),
-            ("PLL Mode", 15, [("Conventional PLL", 0, 0), ("OSPLL", 0, 1)]),
-            ("BBPD", 15, [("BBPD ON", 1, 0), ("BBPD OFF", 1, 1)]),
-            ("Clock Source", 15, [("Use divider clk", 13, 0), ("Use mmpg clk", 13, 1)]),
-            ("Divider Ratio", 15, [("Div 8", 12, 0), ("Div 16", 12, 1)]),
-            ("Retime", 15, [("Retime OFF", 10, 0), ("Retime ON", 10, 1)]),
-            ("Inversion", 15, [("Inversion OFF", 11, 0), ("Inversion ON", 11, 1)]),
+            ("Enable DSM", 0, [("Enable", "en_dsm", 1), ("Disable", "en_dsm", 0)]),
+            ("DLF Mode", 0, [("DLF update", "dlf_mode", 0), ("Free running", "dlf_mode", 1)]),
+            ("PLL Mode", 15, [("Conventional PLL", "pll_mode", 0), ("OSPLL", "pll_mode", 1)]),
+            ("BBPD", 15, [("BBPD ON", "bbpd_off", 0), ("BBPD OFF", "bbpd_off", 1)]),
+            ("Clock Source", 15, [("Use divider clk", "clk_src", 0), ("Use mmpg clk", "clk_src", 1)]),
+            ("Divider Ratio", 15, [("Div 8", "div_ratio", 0), ("Div 16", "div_ratio", 1)]),
+            ("Retime", 15, [("Retime OFF", "retime", 0), ("Retime ON", "retime", 1)]),
+            ("Inversion", 15, [("Inversion OFF", "inversion", 0), ("Inversion ON", "inversion", 1)]),
         ]
 
         # Create radio buttons for each SPI mode option
         for label_text, reg, choices in mode_options:
             frame = LabelFrame(left_frame, text=label_text)
             frame.pack(fill="x", padx=5, pady=2)
-            for i, (text, bit, val) in enumerate(choices):
-                Radiobutton(frame, text=text, variable=self.reg_settings[reg][1][bit], value=val).pack(side="left",
-                                                                                                          padx=5)
+            for i, (text, field, val) in enumerate(choices):
+                Radiobutton(frame, text=text, variable=self.reg_settings[reg][field], value=val).pack(side="left",
+                                                                                                        padx=5)
         # Create parameter entry for kp_dco, ki_dco, init_dco
         for idx, (lbl, var) in enumerate([("kp_dco (0~15):", self.__var_kp),
                                           ("ki_dco (0~15):", self.__var_ki),
@@ -267,31 +296,28 @@ class Application:
         """
         - Write all SPI register values based on current settings
         """
-        for reg_addr, (default_bin, bit_settings) in self.reg_settings.items():
-            print(reg_addr)
-            binary = list(default_bin)
-            for bit, var in bit_settings.items():
-                binary[15 - bit] = str(var.get())
+        reg_values: dict[int, int] = {}
+        for reg_addr, field_vars in self.reg_settings.items():
+            fields = {name: var.get() for name, var in field_vars.items()}
             try:
                 # Special handling for kp, ki, and init_dco fields
                 if reg_addr == 0:
-                    ki_bin = f"{int(self.__var_ki["value"].get()):04b}"
-                    kp_bin = f"{int(self.__var_kp["value"].get()):04b}"
-                    binary[0:4] = list(ki_bin)
-                    binary[4:8] = list(kp_bin)
+                    fields["ki"] = int(self.__var_ki["value"].get())
+                    fields["kp"] = int(self.__var_kp["value"].get())
                 elif reg_addr == 1:
-                    init_bin = f"{self.__var_init_dco["value"].get():010b}"
-                    binary[6:] = list(init_bin)
+                    fields["init_dco"] = int(self.__var_init_dco["value"].get())
+                reg_values[reg_addr] = int(encode(reg_addr, **fields))
             except Exception as e:
                 self.status_label.config(text=f"입력 오류: {e}", foreground="red")
                 return
 
-            hex_val = bin16_to_hex4("".join(binary))
-            try:
-                write_register(reg_addr, hex_val)
-                self.status_label.config(text="쓰기 완료", foreground="green")
-            except Exception as e:
-                self.status_label.config(text=str(e), foreground="red")
+        # Program the whole register map in one SPI batch
+        try:
+            if write_registers(reg_values) < 0:
+                raise IOError("SPI 쓰기 실패")
+            self.status_label.config(text="쓰기 완료", foreground="green")
+        except Exception as e:
+            self.status_label.config(text=str(e), foreground="red")
 
     def write_manual_register(self):
         """
@@ -314,28 +340,25 @@ class Application:
         - Read SPI registers and update GUI with values
         """
         try:
-            a = read_register(2, 20)
-            read_values = [f"{a[i]:02X}{a[i + 1]:02X}" for i in range(0, 40, 2)]
+            words = read_words(2, 20, out=self.__reg_words)
+            if words is None:
+                raise IOError("SPI 읽기 실패")
+            read_values = [f"{w:04X}" for w in words.tolist()]
             addresses = [f"{hex(i)[2:].upper()}" for i in range(0, len(read_values))]
             self.tree.delete(*self.tree.get_children())
             for addr, val in zip(addresses, read_values):
                 self.tree.insert("", "end", values=(addr, val))
 
-            for reg_idx, val_hex in enumerate(read_values):
-                reg_addr = reg_idx
-                if reg_addr in self.reg_settings:
-                    bin_val = f"{int(val_hex, 16):016b}"
-                    for bit, var in self.reg_settings[reg_addr][1].items():
-                        var.set(int(bin_val[15 - bit]))
-
-                    if reg_addr == 0:
-                        ki = int(bin_val[0:4], 2)
-                        kp = int(bin_val[4:8], 2)
-                        self.__var_ki["value"].set(ki)
-                        self.__var_kp["value"].set(kp)
-                    elif reg_addr == 1:
-                        init_dco = int(bin_val[6:], 2)
-                        self.__var_init_dco["value"].set(init_dco)
+            for reg_addr in self.reg_settings:
+                fields = decode(reg_addr, words[reg_addr])
+                for name, var in self.reg_settings[reg_addr].items():
+                    var.set(int(fields[name]))
+
+                if reg_addr == 0:
+                    self.__var_ki["value"].set(int(fields["ki"]))
+                    self.__var_kp["value"].set(int(fields["kp"]))
+                elif reg_addr == 1:
+                    self.__var_init_dco["value"].set(int(fields["init_dco"]))
 
         except Exception as e:
             self.tree.delete(*self.tree.get_children())
@@ -485,15 +508,15 @@ class Application:
         """
         - Apply channel settings to all channels
         """
-        for i in range(1, 4):
-            ch_settings = {'voltage': self.__var_psu[pk][i]["voltage"].get(),
+        ch_settings = {i: {'voltage': self.__var_psu[pk][i]["voltage"].get(),
                            'current': self.__var_psu[pk][i]["current"].get(),
                            'ovp': self.__var_psu[pk][i]["ovp"].get(),
-                           'ocp': self.__var_psu[pk][i]["ocp"].get()}
-            if pk == 'E36313A - 1':
-                self.__psu1.apply_channel_setting(ch_settings, i)
-            elif pk == 'E36313A - 2':
-                self.__psu2.apply_channel_setting(ch_settings, i)
+                           'ocp': self.__var_psu[pk][i]["ocp"].get()} for i in range(1, 4)}
+        # All three channels in one SCPI message
+        if pk == 'E36313A - 1':
+            self.__psu1.setting(ch_settings, [1, 2, 3])
+        elif pk == 'E36313A - 2':
+            self.__psu2.setting(ch_settings, [1, 2, 3])
 
     def tab_SMB100B(self, notebook: Notebook) -> None:
         """
@@ -773,8 +796,8 @@ class Application:
                      self.__var_init_dco["start"].get(),
                      self.__var_init_dco["stop"].get(),
                      self.__var_init_dco["step"].get(),
-                     self.reg_settings[0][1][4].get(),
-                     self.reg_settings[0][1][6].get(),
+                     self.reg_settings[0]["en_dsm"].get(),
+                     self.reg_settings[0]["dlf_mode"].get(),
                      self.__var_kp["value"].get(),
                      self.__var_kp["sweep"].get(),
                      self.__var_kp["start"].get(),
@@ -853,7 +876,12 @@ class Application:
         self.tab_FSV3000(notebook)
         self.tab_measurement(notebook)
         notebook.pack(fill="both", expand=True)
-        window.mainloop()
+
+        self.__spi.acquire()
+        try:
+            window.mainloop()
+        finally:
+            self.__spi.release()
 
 if __name__ == "__main__":
     app = Application()
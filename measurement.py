@@ -1,18 +1,25 @@
 import os
 import csv
 from datetime import datetime
-import time
+import itertools
+from contextlib import nullcontext, ExitStack
 
-from util import bin16_to_hex4, hex4_to_bin16
-from SPI import write_register, read_register
+import numpy as np
+
+from SPI import get_session
+from register import RegisterShadow, encode, decode
+from spi_trace import TraceRecorder
+from profiler import Profiler
 from SHT85 import getTempHumid
 
 def save_settings_csv(log_folder, kp, ki, init_dco, freq, power,
                       voltage_1_1, voltage_1_2, voltage_1_3,
                       voltage_2_1, voltage_2_2, voltage_2_3,
-                      idx, temp, humid):
+                      idx, temp, humid, settle_1=None, settle_2=None):
   """
   - Save(or append) user settings along with temperature and humidity data to setting_log.csv
+  - settle_1/settle_2 are the output settle times of PSU1/PSU2 (unit: s, empty on timeout
+    or when settle_wait is off)
   """
   os.makedirs(log_folder, exist_ok=True)
   path = os.path.join(log_folder, 'setting_log.csv')
@@ -23,11 +30,13 @@ def save_settings_csv(log_folder, kp, ki, init_dco, freq, power,
       writer.writerow(['index', 'kp', 'ki', 'init_dco', 'freq_Hz', 'power_dBm',
                        'voltage_INST1_CH1_V', 'voltage_INST1_CH2_V', 'voltage_INST1_CH3_V',
                        'voltage_INST2_CH1_V', 'voltage_INST2_CH2_V', 'voltage_INST2_CH3_V',
-                       'Temperature', 'Humidity'])
+                       'Temperature', 'Humidity', 'settle_INST1_s', 'settle_INST2_s'])
     writer.writerow([idx, kp, ki, init_dco, freq,
                      power, voltage_1_1, voltage_1_2, voltage_1_3,
                      voltage_2_1, voltage_2_2, voltage_2_3,
-                     round(temp, 2), round(humid, 2)])
+                     round(temp, 2), round(humid, 2),
+                     '' if settle_1 is None else round(settle_1, 4),
+                     '' if settle_2 is None else round(settle_2, 4)])
   return True, path
 
 def append_marker_data(log_folder, freq_hz, amplitude_dbm, freq,
@@ -119,6 +128,32 @@ def append_phase_data(log_folder, jitter, sno_1khz, sno_10khz, sno_100khz, sno_1
     writer.writerows(data_rows)
   return True, path
 
+def arm_psu_list(psu, volt_values, currents):
+  """
+  - Arm a supply with the flattened grid of its three channel voltages (CH1 outermost),
+    so every sweep point only needs a trigger
+  - OVP is set once from the highest voltage of each channel
+  - An empty voltage range leaves nothing to arm; return False so the sweep falls back
+    to per-point setting()
+  """
+  grid = list(itertools.product(*volt_values))
+  if not grid:
+    print("[리스트 모드] 빈 전압 범위")
+    return False
+  settings = {
+    ch: {
+      'voltage': grid[0][ch - 1],
+      'current': currents[ch - 1],
+      'ovp': max(volt_values[ch - 1]) + 2.0,
+      'ocp': False,
+      'output': True
+    } for ch in (1, 2, 3)
+  }
+  if psu.setting(settings, [1, 2, 3]) is not True:
+    return False
+  return psu.arm_list({ch: [point[ch - 1] for point in grid] for ch in (1, 2, 3)},
+                      {ch: currents[ch - 1] for ch in (1, 2, 3)}) is True
+
 def measurement(
     init_dco_single, init_dco_sweep, dco_start, dco_stop, dco_step,
     en_dsm,
@@ -138,12 +173,26 @@ def measurement(
     volt_sweep_1_3, volt_single_1_3, volt_start_1_3, volt_stop_1_3, volt_step_1_3, current_1_3,
     volt_sweep_2_1, volt_single_2_1, volt_start_2_1, volt_stop_2_1, volt_step_2_1, current_2_1,
     volt_sweep_2_2, volt_single_2_2, volt_start_2_2, volt_stop_2_2, volt_step_2_2, current_2_2,
-    volt_sweep_2_3, volt_single_2_3, volt_start_2_3, volt_stop_2_3, volt_step_2_3, current_2_3
+    volt_sweep_2_3, volt_single_2_3, volt_start_2_3, volt_stop_2_3, volt_step_2_3, current_2_3,
+    spi_trace=False,
+    psu_list_mode=False,
+    sgu_list_mode=False,
+    profile=False,
+    settle_wait=False
 ):
   """
   - Measurement automation
   - Run nested measurement loops based on user-defined sweep ranges
     (DCO, KP, KI, frequency, voltage (CH1–CH3 on PSU1 and PSU2))
+  - With spi_trace, every Cheetah call is recorded to spi_trace.bin in the log folder
+  - With psu_list_mode, the supply voltage grids are uploaded as list sweeps before the loop
+    and each point is stepped with a bus trigger
+  - With sgu_list_mode, the frequency points are uploaded to the signal generator once
+    and selected by list index
+  - With profile, every instrument driver call is timed and its SCPI traffic counted;
+    profile_summary.csv and profile_points.csv are written next to marker_table.csv
+  - With settle_wait, each point waits until both supplies read back stable outputs and
+    the settle times are logged to setting_log.csv
   """
 
   #Time-based log folder creation
@@ -155,8 +204,6 @@ def measurement(
   # Check for sweep status
   dco_values = []
 
-  binary_reg1 = list("0000000010000111")
-
   if init_dco_sweep:
     val = dco_start
     while val <= dco_stop:
@@ -168,11 +215,6 @@ def measurement(
   kp_values = []
   ki_values = []
 
-  binary_reg0 = list("0111011100011001")
-
-  binary_reg0[15 - 4] = str(en_dsm)
-  binary_reg0[15 - 6] = str(dlf_mode)
-
   if kp_sweep:
     val = kp_start
     while val <= kp_stop:
@@ -260,197 +302,232 @@ def measurement(
   else :
     volt_values_2_3.append(volt_single_2_3)
 
+  # Encode every register word of the DCO/KP/KI grid up front
+  try:
+    reg1_words = encode(1, init_dco=dco_values)
+    reg0_words = encode(0, en_dsm=en_dsm, dlf_mode=dlf_mode,
+                        kp=np.asarray(kp_values)[:, None], ki=np.asarray(ki_values)[None, :])
+  except Exception as e:
+    print("reg"+str(e))
+    return False, e
+
   # Set the overall index number
   total_idx = 1
 
-  # DCO sweep
-  for idx, dco in enumerate(dco_values):
-    dco_bin = f"{int(dco):010b}"
-    binary_reg1[6:] = list(dco_bin)
-
-    hex_val = bin16_to_hex4("".join(binary_reg1))
-
-    try:
-      write_register(1, hex_val)
-      reg1 = read_register(2, 20)
-      reg1 = hex4_to_bin16(f"{reg1[2]:02X}{reg1[3]:02X}")
-    except Exception as e:
-      print("reg1"+str(e))
-      return False, e
-
-    # kp sweep
-    for idx_kp, kp in enumerate(kp_values):
-      kp_bin = f"{int(kp):04b}"
-      binary_reg0[4:8] = list(kp_bin)
-
-      #ki sweep
-      for idx_ki, ki in enumerate(ki_values):
-        ki_bin = f"{int(ki):04b}"
-        binary_reg0[0:4] = list(ki_bin)
-        hex_val = bin16_to_hex4("".join(binary_reg0))
-
-        try:
-          write_register(0, hex_val)
-          reg0 = read_register(2, 20)
-          reg0 = hex4_to_bin16(f"{reg0[0]:02X}{reg0[1]:02X}")
-        except Exception as e:
-          print("reg0"+str(e))
-          return False, e
-
-        # frequency sweep
-        for idx_freq, freq in enumerate(freq_values):
-          sgu.set_frequency(freq)
-          sgu.set_power(power_dbm)
-          sgu.rf_on()
-
-          # Power supply sweep(6 channel)
-          for idx_vol_1_1, voltage_1_1 in enumerate(volt_values_1_1):
-            ch_settings_1_1 = {
-              1: {
-                'voltage': voltage_1_1,
-                'current': current_1_1,
-                'ovp': voltage_1_1 + 2.0,
-                'ocp': False,
-                'output': True
-              }
-            }
-
-            for idx_vol_1_2, voltage_1_2 in enumerate(volt_values_1_2):
-              ch_settings_1_2 = {
-                2: {
-                  'voltage': voltage_1_2,
-                  'current': current_1_2,
-                  'ovp': voltage_1_2 + 2.0,
+  # Time every driver call; the hooks are attached on entering the with block below
+  profiler = Profiler(local_folder, {"E36313A - 1": psu1, "E36313A - 2": psu2,
+                                     "SMB100B": sgu, "FSV3000": sau}) if profile else nullcontext()
+  recorder = TraceRecorder(os.path.join(local_folder, "spi_trace.bin")) if spi_trace else nullcontext()
+  # Lists armed below are aborted when the sweep ends
+  list_guard = ExitStack()
+
+  # Hold the shared Cheetah session open for the whole sweep
+  with profiler, recorder, list_guard, get_session() as spi:
+    # Arm both supplies once
+    if psu_list_mode:
+      armed_1 = arm_psu_list(psu1, (volt_values_1_1, volt_values_1_2, volt_values_1_3),
+                             (current_1_1, current_1_2, current_1_3))
+      armed_2 = armed_1 and arm_psu_list(psu2, (volt_values_2_1, volt_values_2_2, volt_values_2_3),
+                                         (current_2_1, current_2_2, current_2_3))
+      if armed_1:
+        list_guard.callback(psu1.abort_list)
+      if armed_2:
+        list_guard.callback(psu2.abort_list)
+      if not (armed_1 and armed_2):
+        print("[리스트 모드 실패] 채널별 설정으로 진행")
+        list_guard.close()
+        psu_list_mode = False
+    last_psu1_point = None
+
+    if sgu_list_mode:
+      if sgu.arm_list(freq_values, power_dbm) is True:
+        list_guard.callback(sgu.abort_list)
+      else:
+        print("[리스트 모드 실패] 주파수별 설정으로 진행")
+        sgu_list_mode = False
+
+    # Registers whose value did not change between sweep points are not rewritten
+    shadow = RegisterShadow(spi)
+
+    # DCO sweep
+    for idx, dco in enumerate(dco_values):
+      try:
+        reg1 = decode(1, shadow.write({1: reg1_words[idx]}, verify=True)[1])
+      except Exception as e:
+        print("reg1"+str(e))
+        return False, e
+
+      # kp sweep
+      for idx_kp, kp in enumerate(kp_values):
+        #ki sweep
+        for idx_ki, ki in enumerate(ki_values):
+          try:
+            reg0 = decode(0, shadow.write({0: reg0_words[idx_kp, idx_ki]}, verify=True)[0])
+          except Exception as e:
+            print("reg0"+str(e))
+            return False, e
+
+          # frequency sweep
+          for idx_freq, freq in enumerate(freq_values):
+            if profile:
+              profiler.set_point(total_idx)
+
+            if sgu_list_mode:
+              sgu.list_index(idx_freq)
+            else:
+              sgu.set_frequency(freq)
+              sgu.set_power(power_dbm)
+              sgu.rf_on()
+
+            # Power supply sweep(6 channel)
+            for idx_vol_1_1, voltage_1_1 in enumerate(volt_values_1_1):
+              ch_settings_1_1 = {
+                1: {
+                  'voltage': voltage_1_1,
+                  'current': current_1_1,
+                  'ovp': voltage_1_1 + 2.0,
                   'ocp': False,
                   'output': True
                 }
               }
 
-              for idx_vol_1_3, voltage_1_3 in enumerate(volt_values_1_3):
-                ch_settings_1_3 = {
-                  3: {
-                    'voltage': voltage_1_3,
-                    'current': current_1_3,
-                    'ovp': voltage_1_3 + 2.0,
+              for idx_vol_1_2, voltage_1_2 in enumerate(volt_values_1_2):
+                ch_settings_1_2 = {
+                  2: {
+                    'voltage': voltage_1_2,
+                    'current': current_1_2,
+                    'ovp': voltage_1_2 + 2.0,
                     'ocp': False,
                     'output': True
                   }
                 }
 
-                for idx_vol_2_1, voltage_2_1 in enumerate(volt_values_2_1):
-                  ch_settings_2_1 = {
-                    1: {
-                      'voltage': voltage_2_1,
-                      'current': current_2_1,
-                      'ovp': voltage_2_1 + 2.0,
+                for idx_vol_1_3, voltage_1_3 in enumerate(volt_values_1_3):
+                  ch_settings_1_3 = {
+                    3: {
+                      'voltage': voltage_1_3,
+                      'current': current_1_3,
+                      'ovp': voltage_1_3 + 2.0,
                       'ocp': False,
                       'output': True
                     }
                   }
 
-                  for idx_vol_2_2, voltage_2_2 in enumerate(volt_values_2_2):
-                    ch_settings_2_2 = {
-                      2: {
-                        'voltage': voltage_2_2,
-                        'current': current_2_2,
-                        'ovp': voltage_2_2 + 2.0,
+                  for idx_vol_2_1, voltage_2_1 in enumerate(volt_values_2_1):
+                    ch_settings_2_1 = {
+                      1: {
+                        'voltage': voltage_2_1,
+                        'current': current_2_1,
+                        'ovp': voltage_2_1 + 2.0,
                         'ocp': False,
                         'output': True
                       }
                     }
 
-                    for idx_vol_2_3, voltage_2_3 in enumerate(volt_values_2_3):
-                      ch_settings_2_3 = {
-                        3: {
-                          'voltage': voltage_2_3,
-                          'current': current_2_3,
-                          'ovp': voltage_2_3 + 2.0,
+                    for idx_vol_2_2, voltage_2_2 in enumerate(volt_values_2_2):
+                      ch_settings_2_2 = {
+                        2: {
+                          'voltage': voltage_2_2,
+                          'current': current_2_2,
+                          'ovp': voltage_2_2 + 2.0,
                           'ocp': False,
                           'output': True
                         }
                       }
 
-                      # Save(or append) user settings along with temperature and humidity data
-                      psu1.setting(ch_settings_1_1, [1])
-                      psu1.setting(ch_settings_1_2, [2])
-                      psu1.setting(ch_settings_1_3, [3])
-                      psu2.setting(ch_settings_2_1, [1])
-                      psu2.setting(ch_settings_2_2, [2])
-                      psu2.setting(ch_settings_2_3, [3])
-
-                      (a_temp, a_humid) = getTempHumid()
-
-                      save_settings_csv(local_folder, int("".join(reg0[4:8]), 2),
-                                        int("".join(reg0[0:4]), 2), int("".join(reg1), 2),
-                                        freq, power_dbm, voltage_1_1, voltage_1_2, voltage_1_3,
-                                        voltage_2_1, voltage_2_3, voltage_2_3,  total_idx,
-                                        a_temp, a_humid)
-
-                      # Power spectrum routine
-                      sau.set_spectrum()
-                      sau.set_rbw_spectrum(3e3)
-                      sau.set_vbw_spectrum(30e3)
-                      time.sleep(1)
-                      sau.remove_spectrum_table()
-                      sau.auto_set_all()
-                      time.sleep(15)
-
-                      sau.set_span(span_hz)
-                      time.sleep(5)
-                      sau.set_spectrum_table()
-                      time.sleep(1)
-                      sau.marker_peak_search()
-                      time.sleep(2)
-
-                      peak_freq = sau.get_marker()
-                      time.sleep(2)
-                      peak_amp = sau.get_marker_value()
-                      time.sleep(2)
-                      peak_amp = float(peak_amp)
-                      time.sleep(2)
-
-                      sau.capture_spectrum(capture_path, f'{total_idx}.')
-
-                      # Save(or append) actual output values from measurement equipment
-                      psu1_pwr_1 = psu1.status_voltage(1)
-                      psu1_pwr_2 = psu1.status_voltage(2)
-                      psu1_pwr_3 = psu1.status_voltage(3)
-                      psu2_pwr_1 = psu2.status_voltage(1)
-                      psu2_pwr_2 = psu2.status_voltage(2)
-                      psu2_pwr_3 = psu2.status_voltage(3)
-
-                      append_marker_data(local_folder, peak_freq, peak_amp, freq,
-                                         psu1_pwr_1, psu1_pwr_2, psu1_pwr_3,
-                                         psu2_pwr_1, psu2_pwr_2, psu2_pwr_3, total_idx)
-                      sau.remove_spectrum_table()
-                      time.sleep(1)
-
-                      # Phase noise routine
-                      sau.set_phase_noise()
-                      sau.set_verify_off()
-                      time.sleep(1)
-
-                      sau.remove_noise_table()
-                      time.sleep(1)
-                      sau.set_noise_table()
-                      time.sleep(1)
-                      jitter = sau.set_jitter(offset_start, offset_stop, rbw_ratio)
-                      sno = sau.get_spot_noise()
-                      time.sleep(2)
-
-                      # Append jitter and phase noise values to the last row of 'marker_table.csv'
-                      append_phase_data(local_folder, jitter, sno[0]["Phase_noise_dBc/Hz"],
-                                        sno[1]["Phase_noise_dBc/Hz"], sno[2]["Phase_noise_dBc/Hz"],
-                                        sno[3]["Phase_noise_dBc/Hz"], sno[4]["Phase_noise_dBc/Hz"])
-
-                      sau.capture_phase_noise(capture_path, f'{total_idx}.')
-
-                      # Clear instrument status and error buffer
-                      psu1.buff_clear()
-                      psu2.buff_clear()
-                      sau.buff_clear()
-
-                      sau.remove_noise_table()
-                      time.sleep(2)
-                      total_idx += 1
+                      for idx_vol_2_3, voltage_2_3 in enumerate(volt_values_2_3):
+                        ch_settings_2_3 = {
+                          3: {
+                            'voltage': voltage_2_3,
+                            'current': current_2_3,
+                            'ovp': voltage_2_3 + 2.0,
+                            'ocp': False,
+                            'output': True
+                          }
+                        }
+                        if profile:
+                          profiler.set_point(total_idx)
+
+                        # Save(or append) user settings along with temperature and humidity data
+                        if psu_list_mode:
+                          # psu1 steps only when its own point changes, psu2 on every point
+                          psu1_point = (idx_vol_1_1, idx_vol_1_2, idx_vol_1_3)
+                          if psu1_point != last_psu1_point:
+                            psu1.trigger()
+                            last_psu1_point = psu1_point
+                          psu2.trigger()
+                        else:
+                          # One SCPI message per supply for all three channels
+                          psu1.setting({**ch_settings_1_1, **ch_settings_1_2, **ch_settings_1_3}, [1, 2, 3])
+                          psu2.setting({**ch_settings_2_1, **ch_settings_2_2, **ch_settings_2_3}, [1, 2, 3])
+
+                        # Wait until the outputs are stable
+                        settle_1 = settle_2 = None
+                        if settle_wait:
+                          settle_1 = psu1.wait_settled()
+                          settle_2 = psu2.wait_settled()
+
+                        (a_temp, a_humid) = getTempHumid()
+
+                        save_settings_csv(local_folder, int(reg0["kp"]),
+                                          int(reg0["ki"]), int(reg1["init_dco"]),
+                                          freq, power_dbm, voltage_1_1, voltage_1_2, voltage_1_3,
+                                          voltage_2_1, voltage_2_3, voltage_2_3,  total_idx,
+                                          a_temp, a_humid, settle_1, settle_2)
+
+                        # Power spectrum routine
+                        sau.set_spectrum()
+                        sau.set_rbw_spectrum(3e3)
+                        sau.set_vbw_spectrum(30e3)
+                        sau.remove_spectrum_table()
+                        sau.auto_set_all()
+
+                        sau.set_span(span_hz)
+                        sau.set_spectrum_table()
+                        sau.marker_peak_search()
+
+                        peak_freq = sau.get_marker()
+                        peak_amp = sau.get_marker_value()
+                        peak_amp = float(peak_amp)
+
+                        sau.capture_spectrum(capture_path, f'{total_idx}.')
+
+                        # Save(or append) actual output values from measurement equipment
+                        # One query per supply for all three channels
+                        psu1_meas = psu1.measure_all() or {}
+                        psu2_meas = psu2.measure_all() or {}
+                        psu1_pwr_1, psu1_pwr_2, psu1_pwr_3 = (psu1_meas[ch].voltage if ch in psu1_meas else None for ch in (1, 2, 3))
+                        psu2_pwr_1, psu2_pwr_2, psu2_pwr_3 = (psu2_meas[ch].voltage if ch in psu2_meas else None for ch in (1, 2, 3))
+
+                        append_marker_data(local_folder, peak_freq, peak_amp, freq,
+                                           psu1_pwr_1, psu1_pwr_2, psu1_pwr_3,
+                                           psu2_pwr_1, psu2_pwr_2, psu2_pwr_3, total_idx)
+                        sau.remove_spectrum_table()
+
+                        # Phase noise routine
+                        sau.set_phase_noise()
+                        sau.set_verify_off()
+
+                        sau.remove_noise_table()
+                        sau.set_noise_table()
+                        jitter = sau.set_jitter(offset_start, offset_stop, rbw_ratio)
+                        if isinstance(jitter, tuple):
+                          # Jitter measurement failed: keep the row, leave the value empty
+                          jitter = ''
+                        sno = sau.get_spot_noise()
+
+                        # Append jitter and phase noise values to the last row of 'marker_table.csv'
+                        append_phase_data(local_folder, jitter, sno[0]["Phase_noise_dBc/Hz"],
+                                          sno[1]["Phase_noise_dBc/Hz"], sno[2]["Phase_noise_dBc/Hz"],
+                                          sno[3]["Phase_noise_dBc/Hz"], sno[4]["Phase_noise_dBc/Hz"])
+
+                        sau.capture_phase_noise(capture_path, f'{total_idx}.')
+
+                        # Clear instrument status and error buffer
+                        psu1.buff_clear()
+                        psu2.buff_clear()
+                        sau.buff_clear()
+
+                        sau.remove_noise_table()
+                        total_idx += 1
   print("측정이 종료됨.")
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+- Per-operation timing profiler for the instrument drivers
+- Records wall time, SCPI command count and bytes of every driver call, grouped by sweep point
+"""
+import csv
+import os
+import threading
+import time
+from collections import defaultdict
+
+import visa_pool
+
+class Profiler:
+    def __init__(self, log_folder=None, drivers: dict | None = None):
+        """
+        - Initialize the class
+        - Only the outermost driver call of a thread is recorded, so calls made by other
+          methods of the same driver are counted once
+        - Used as a context manager, drivers ({device name: driver}) are hooked on entry;
+          on exit the hooks are removed and the profile is written to log_folder
+        """
+        self.__log_folder = log_folder
+        self.__drivers = drivers or {}
+        self.__records = []
+        self.__points = []
+        self.__point = None
+        self.__point_start = None
+        self.__attached = []
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        try:
+            for device, driver in self.__drivers.items():
+                self.attach(driver, device)
+        except BaseException:
+            self.detach()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.detach()
+        if self.__log_folder:
+            self.write_csv(self.__log_folder)
+        return False
+
+    def attach(self, driver, device=None):
+        """
+        - Wrap every public method of a driver instance with the timing hook
+        """
+        device = device or type(driver).__name__
+        for name in dir(type(driver)):
+            if name.startswith("_") or not callable(getattr(type(driver), name)):
+                continue
+            setattr(driver, name, self.__wrap(device, name, getattr(driver, name)))
+            self.__attached.append((driver, name))
+
+    def detach(self):
+        """
+        - Remove the timing hooks from every attached driver
+        """
+        for driver, name in self.__attached:
+            driver.__dict__.pop(name, None)
+        self.__attached.clear()
+
+    def __wrap(self, device, name, method):
+        def profiled(*args, **kwargs):
+            if getattr(self.__local, "active", False):
+                return method(*args, **kwargs)
+
+            self.__local.active = True
+            before = visa_pool.snapshot()
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                after = visa_pool.snapshot()
+                self.__local.active = False
+                with self.__lock:
+                    self.__records.append((self.__point, device, name, elapsed,
+                                           after["commands"] - before["commands"],
+                                           after["bytes_sent"] - before["bytes_sent"],
+                                           after["bytes_received"] - before["bytes_received"]))
+
+        return profiled
+
+    def set_point(self, point):
+        """
+        - Start a new sweep point; the wall time of the previous one is closed
+        - Calling it again with the current point does nothing
+        """
+        now = time.perf_counter()
+        with self.__lock:
+            if point == self.__point and self.__point_start is not None:
+                return
+            if self.__point_start is not None:
+                self.__points.append((self.__point, now - self.__point_start))
+            self.__point = point
+            self.__point_start = now
+
+    def summary(self):
+        """
+        - Return per (device, method): calls, total/mean/max time, commands and bytes
+        """
+        table = defaultdict(lambda: {"calls": 0, "total_s": 0.0, "max_s": 0.0,
+                                     "commands": 0, "bytes_sent": 0, "bytes_received": 0})
+        with self.__lock:
+            for point, device, name, elapsed, commands, sent, received in self.__records:
+                entry = table[(device, name)]
+                entry["calls"] += 1
+                entry["total_s"] += elapsed
+                entry["max_s"] = max(entry["max_s"], elapsed)
+                entry["commands"] += commands
+                entry["bytes_sent"] += sent
+                entry["bytes_received"] += received
+
+        for entry in table.values():
+            entry["mean_s"] = entry["total_s"] / entry["calls"]
+        return dict(sorted(table.items(), key=lambda item: -item[1]["total_s"]))
+
+    def write_csv(self, log_folder):
+        """
+        - Write profile_summary.csv (per method) and profile_points.csv (per sweep point)
+          to log_folder
+        """
+        self.set_point(None)
+        os.makedirs(log_folder, exist_ok=True)
+
+        summary_path = os.path.join(log_folder, 'profile_summary.csv')
+        with open(summary_path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['device', 'method', 'calls', 'total_s', 'mean_s', 'max_s',
+                             'commands', 'bytes_sent', 'bytes_received'])
+            for (device, name), entry in self.summary().items():
+                writer.writerow([device, name, entry["calls"], round(entry["total_s"], 4),
+                                 round(entry["mean_s"], 4), round(entry["max_s"], 4),
+                                 entry["commands"], entry["bytes_sent"], entry["bytes_received"]])
+
+        points_path = os.path.join(log_folder, 'profile_points.csv')
+        with self.__lock:
+            # {point: {(device, method): [time, commands, sent, received]}}, in one pass
+            per_point = defaultdict(lambda: defaultdict(lambda: [0.0, 0, 0, 0]))
+            for point, device, name, elapsed, commands, sent, received in self.__records:
+                entry = per_point[point][(device, name)]
+                entry[0] += elapsed
+                entry[1] += commands
+                entry[2] += sent
+                entry[3] += received
+            points = list(self.__points)
+
+        with open(points_path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['index', 'device', 'method', 'time_s', 'commands', 'bytes_sent', 'bytes_received'])
+            for point, wall_s in points:
+                if point is None:
+                    continue
+                writer.writerow([point, '', '(point total)', round(wall_s, 4), '', '', ''])
+                for (device, name), (elapsed, commands, sent, received) in per_point.get(point, {}).items():
+                    writer.writerow([point, device, name, round(elapsed, 4), commands, sent, received])
+
+        print(f"[프로파일 저장] {summary_path}")
+        return True, summary_path
@@ -0,0 +1,213 @@
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from SPI import AsyncSPI, read_words, write_registers, get_session, save_bitrate, DEFAULT_BITRATE_KHZ
+
+# The readback command dumps the register file starting from register 0
+READBACK_ADDRESS = 2
+REGISTER_COUNT = 20
+
+# Register used for bitrate calibration; its value is restored afterwards
+SCRATCH_ADDRESS = 19
+# Bitrates tried by calibrate_bitrate, slowest first (unit: kHz)
+CALIBRATION_RATES_KHZ = (100, 200, 500, 1000, 2000, 4000, 8000, 10000, 20000, 30000, 40000)
+# Bit patterns written to the scratch register at every rate
+CALIBRATION_PATTERNS = (0x0000, 0xFFFF, 0xAAAA, 0x5555, 0x00FF, 0xFF00, 0x8001, 0x7FFE)
+
+class BitField(NamedTuple):
+    offset: int
+    width: int
+
+    @property
+    def mask(self):
+        return ((1 << self.width) - 1) << self.offset
+
+class RegisterDef(NamedTuple):
+    name: str
+    reset: int
+    fields: dict[str, BitField]
+
+# Register map of the PLL test chip (bit 0 = LSB)
+REGISTER_MAP: dict[int, RegisterDef] = {
+    0: RegisterDef("loop_filter", 0x7719, {
+        "en_dsm":    BitField(4, 1),     # 1: DSM enable
+        "dlf_mode":  BitField(6, 1),     # 0: DLF update, 1: free running
+        "kp":        BitField(8, 4),     # kp_dco
+        "ki":        BitField(12, 4),    # ki_dco
+    }),
+    1: RegisterDef("dco", 0x0087, {
+        "init_dco":  BitField(0, 10),    # init_dco
+    }),
+    15: RegisterDef("pll_mode", 0x0004, {
+        "pll_mode":  BitField(0, 1),     # 0: conventional PLL, 1: OSPLL
+        "bbpd_off":  BitField(1, 1),     # 0: BBPD ON, 1: BBPD OFF
+        "retime":    BitField(10, 1),    # 1: retime ON
+        "inversion": BitField(11, 1),    # 1: inversion ON
+        "div_ratio": BitField(12, 1),    # 0: div 8, 1: div 16
+        "clk_src":   BitField(13, 1),    # 0: divider clk, 1: mmpg clk
+    }),
+}
+
+def encode(address, base=None, **fields):
+    """
+    - Pack field values into 16-bit register words
+    - Field values may be scalars or arrays; they are broadcast against each other,
+      so a whole sweep grid is encoded in one call
+    """
+    reg = REGISTER_MAP[address]
+    word = np.asarray(reg.reset if base is None else base, dtype=np.uint32)
+
+    for name, value in fields.items():
+        field = reg.fields[name]
+        value = np.asarray(value, dtype=np.int64)
+        if np.any((value < 0) | (value >> field.width)):
+            raise ValueError(f"REG{address}.{name} 범위 초과 (0~{(1 << field.width) - 1})")
+        word = (word & np.uint32(0xFFFF ^ field.mask)) | (value.astype(np.uint32) << np.uint32(field.offset))
+
+    return word.astype(np.uint16)
+
+def decode(address, words):
+    """
+    - Unpack 16-bit register words into a dictionary of field arrays
+    """
+    words = np.asarray(words, dtype=np.uint16)
+    return {name: (words >> np.uint16(field.offset)) & np.uint16((1 << field.width) - 1)
+            for name, field in REGISTER_MAP[address].fields.items()}
+
+class RegisterShadow:
+    def __init__(self, session=None):
+        """
+        - Initialize the class
+        - Keeps the last value written to each register so unchanged registers are not resent
+        """
+        self.__session = session or get_session()
+        self.__spi = AsyncSPI(self.__session)
+        self.__values: list[int | None] = [None] * REGISTER_COUNT
+        # Verify readback lands here instead of a new array per sweep point
+        self.__readback = np.zeros(REGISTER_COUNT, dtype=np.uint16)
+        self.__lock = threading.Lock()
+
+    def get(self, address):
+        """
+        - Return the shadowed value of a register, or None if it is unknown
+        """
+        return self.__values[address]
+
+    def invalidate(self, address=None):
+        """
+        - Forget the shadowed value of one register, or of all registers
+        """
+        with self.__lock:
+            if address is None:
+                self.__values = [None] * REGISTER_COUNT
+            else:
+                self.__values[address] = None
+
+    def load(self):
+        """
+        - Read the whole register file back and use it as the shadow
+        """
+        with self.__lock:
+            words = read_words(READBACK_ADDRESS, REGISTER_COUNT, self.__session, self.__readback)
+            if words is None:
+                raise IOError("레지스터 읽기 실패")
+            self.__values = words.tolist()
+            return list(self.__values)
+
+    def write(self, reg_values: dict[int, int], verify=False):
+        """
+        - Write only the registers whose value differs from the shadow, in one SPI batch
+        - With verify, read back the registers that were written; the readback batch is
+          submitted right behind the write so both are in flight together
+        - Return the current value of every requested register
+        """
+        with self.__lock, self.__session:
+            dirty = {addr: int(val) for addr, val in reg_values.items() if self.__values[addr] != int(val)}
+
+            if dirty:
+                written = self.__spi.write(dirty)
+                # Only as much of the register file as covers the dirty registers is read back
+                readback = self.__spi.read(READBACK_ADDRESS, max(dirty) + 1, self.__readback) if verify else None
+
+                try:
+                    self.__spi.wait(written)
+                    words = self.__spi.wait(readback) if verify else None
+                except IOError as e:
+                    self.__spi.flush()
+                    for addr in dirty:
+                        self.__values[addr] = None
+                    raise IOError(f"레지스터 쓰기 실패: {sorted(dirty)}") from e
+
+                for addr, val in dirty.items():
+                    self.__values[addr] = val
+
+                if verify:
+                    self.__verify(dirty, words)
+
+            return {addr: self.__values[addr] for addr in reg_values}
+
+    def __verify(self, expected: dict[int, int], words):
+        """
+        - Compare the read back words with the written values
+        - Mismatching registers take the read value so that the next write resends them
+        """
+        for addr, val in expected.items():
+            read_val = int(words[addr])
+            if read_val != val:
+                print(f"[레지스터 검증 실패] REG{addr}: 쓰기 {val:04X}, 읽기 {read_val:04X}")
+            self.__values[addr] = read_val
+
+def _verify_bitrate(session, scratch_address, rounds):
+    """
+    - Write each calibration pattern to the scratch register and read it back
+    - Only the scratch register is compared, since other registers may hold status bits
+    - Return True if every pattern is read back unchanged
+    """
+    for _ in range(rounds):
+        for pattern in CALIBRATION_PATTERNS:
+            if write_registers({scratch_address: pattern}, session) < 0:
+                return False
+            # The readback always starts at register 0
+            words = read_words(READBACK_ADDRESS, scratch_address + 1, session)
+            if words is None or int(words[scratch_address]) != pattern:
+                return False
+    return True
+
+def calibrate_bitrate(session=None, rates=CALIBRATION_RATES_KHZ, scratch_address=SCRATCH_ADDRESS, rounds=4):
+    """
+    - Ramp the SPI bitrate and verify every rate with write/readback of a scratch register
+    - The highest rate that passes, together with all slower ones, is saved for the
+      adapter's unique ID and used by the session from then on
+    - Return the calibrated bitrate(unit: kHz)
+    """
+    session = session or get_session()
+
+    with session:
+        # Original scratch value, read at the default rate
+        session.configure(bitrate_khz=DEFAULT_BITRATE_KHZ)
+        reference = read_words(READBACK_ADDRESS, scratch_address + 1, session)
+        if reference is None:
+            raise IOError("레지스터 읽기 실패")
+        original = int(reference[scratch_address])
+
+        best = DEFAULT_BITRATE_KHZ
+        try:
+            for rate in sorted(rates):
+                session.configure(bitrate_khz=rate)
+                if not _verify_bitrate(session, scratch_address, rounds):
+                    print(f"[SPI bitrate] {session.bitrate()} kHz 검증 실패")
+                    break
+                best = session.bitrate()
+                print(f"[SPI bitrate] {best} kHz 통과")
+        finally:
+            # Restore the scratch register at the default rate
+            session.configure(bitrate_khz=DEFAULT_BITRATE_KHZ)
+            write_registers({scratch_address: original}, session)
+
+        session.configure(bitrate_khz=best)
+        save_bitrate(session.unique_id(), best)
+
+    print(f"[SPI bitrate] {best} kHz 사용")
+    return best
@@ -0,0 +1,212 @@
+"""
+- Record the Cheetah calls made by SPI.py to a compact binary log, summarize and replay it
+- usage: python spi_trace.py summary <trace>
+         python spi_trace.py replay <trace>
+"""
+import argparse
+import struct
+import threading
+import time
+from array import array
+
+import SPI
+
+MAGIC = b"CHTRACE2"
+
+# Record header: start time since trace start (ns), duration (ns), op code, result, payload length
+# (a 32-bit length, since one batch can shift more than 64 KiB)
+RECORD = struct.Struct("<QIBiI")
+
+OP_OPEN, OP_CLOSE, OP_BITRATE, OP_CONFIGURE, OP_QUEUE_CLEAR, OP_QUEUE_OE, OP_QUEUE_SS, \
+    OP_QUEUE_ARRAY, OP_BATCH_SHIFT, OP_ASYNC_SUBMIT, OP_ASYNC_COLLECT = range(11)
+
+OP_NAMES = {
+    OP_OPEN: "ch_open", OP_CLOSE: "ch_close", OP_BITRATE: "ch_spi_bitrate",
+    OP_CONFIGURE: "ch_spi_configure", OP_QUEUE_CLEAR: "ch_spi_queue_clear",
+    OP_QUEUE_OE: "ch_spi_queue_oe", OP_QUEUE_SS: "ch_spi_queue_ss",
+    OP_QUEUE_ARRAY: "ch_spi_queue_array", OP_BATCH_SHIFT: "ch_spi_batch_shift",
+    OP_ASYNC_SUBMIT: "ch_spi_async_submit", OP_ASYNC_COLLECT: "ch_spi_async_collect",
+}
+
+# Operations that wait on a USB round trip
+TRANSFER_OPS = (OP_OPEN, OP_BATCH_SHIFT, OP_ASYNC_COLLECT)
+
+def _payload_bytes(data):
+    """
+    - Return the bytes of an array argument given as an array or as (array, length)
+    """
+    if isinstance(data, tuple):
+        return bytes(data[0][:int(data[1])])
+    return bytes(data)
+
+class TraceRecorder:
+    def __init__(self, path):
+        """
+        - Initialize the class
+        - While active, every Cheetah call made by SPI.py is appended to the trace file
+        """
+        self.__path = path
+        self.__file = None
+        self.__originals = {}
+        self.__t0 = 0
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def __write(self, start_ns, op, result, payload=b""):
+        """
+        - Append one record to the trace file
+        """
+        duration = min(time.monotonic_ns() - start_ns, 0xFFFFFFFF)
+        result = result[0] if isinstance(result, tuple) else result
+        with self.__lock:
+            self.__file.write(RECORD.pack(start_ns - self.__t0, duration, op, int(result), len(payload)))
+            self.__file.write(payload)
+
+    def __wrap(self, name, op, payload_of):
+        """
+        - Replace SPI.<name> by a wrapper that records the call
+        - payload_of(args, result) returns the bytes to store with the record
+        """
+        func = getattr(SPI, name)
+        self.__originals[name] = func
+
+        def recorded(*args):
+            start_ns = time.monotonic_ns()
+            result = func(*args)
+            self.__write(start_ns, op, result, payload_of(args, result))
+            return result
+
+        setattr(SPI, name, recorded)
+
+    def start(self):
+        """
+        - Open the trace file and start recording
+        """
+        self.__file = open(self.__path, "wb")
+        self.__file.write(MAGIC)
+        self.__t0 = time.monotonic_ns()
+
+        self.__wrap("ch_open", OP_OPEN, lambda args, result: struct.pack("<H", args[0]))
+        self.__wrap("ch_close", OP_CLOSE, lambda args, result: b"")
+        self.__wrap("ch_spi_bitrate", OP_BITRATE, lambda args, result: struct.pack("<i", args[1]))
+        self.__wrap("ch_spi_configure", OP_CONFIGURE, lambda args, result: bytes(args[1:5]))
+        self.__wrap("ch_spi_queue_clear", OP_QUEUE_CLEAR, lambda args, result: b"")
+        self.__wrap("ch_spi_queue_oe", OP_QUEUE_OE, lambda args, result: bytes([args[1]]))
+        self.__wrap("ch_spi_queue_ss", OP_QUEUE_SS, lambda args, result: bytes([args[1]]))
+        self.__wrap("ch_spi_queue_array", OP_QUEUE_ARRAY, lambda args, result: _payload_bytes(args[1]))
+        self.__wrap("ch_spi_batch_shift", OP_BATCH_SHIFT, lambda args, result: bytes(result[1]))
+        self.__wrap("ch_spi_async_submit", OP_ASYNC_SUBMIT, lambda args, result: b"")
+        self.__wrap("ch_spi_async_collect", OP_ASYNC_COLLECT, lambda args, result: bytes(result[1]))
+
+    def stop(self):
+        """
+        - Restore the original Cheetah calls and close the trace file
+        """
+        for name, func in self.__originals.items():
+            setattr(SPI, name, func)
+        self.__originals.clear()
+
+        if self.__file:
+            self.__file.close()
+            self.__file = None
+
+def read_trace(path):
+    """
+    - Yield (start_ns, duration_ns, op, result, payload) for every record of a trace file
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"SPI trace 파일 아님: {path}")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            start_ns, duration_ns, op, result, length = RECORD.unpack(header)
+            yield start_ns, duration_ns, op, result, f.read(length)
+
+def summarize(path):
+    """
+    - Return call counts and time spent per Cheetah call, plus the traced span
+    """
+    ops = {}
+    first = last = None
+    for start_ns, duration_ns, op, result, payload in read_trace(path):
+        entry = ops.setdefault(OP_NAMES.get(op, str(op)), {"calls": 0, "time_s": 0.0, "bytes": 0, "errors": 0})
+        entry["calls"] += 1
+        entry["time_s"] += duration_ns / 1e9
+        entry["bytes"] += len(payload)
+        entry["errors"] += result < 0
+        first = start_ns if first is None else first
+        last = start_ns + duration_ns
+
+    transfer_s = sum(ops.get(OP_NAMES[op], {}).get("time_s", 0.0) for op in TRANSFER_OPS)
+    span_s = (last - first) / 1e9 if first is not None else 0.0
+    return {"span_s": span_s, "transfer_s": transfer_s, "ops": ops}
+
+def replay(path, session=None):
+    """
+    - Re-issue a recorded sequence against the adapter as fast as possible
+    - Return the number of transfers, the ones whose received bytes differ from the trace,
+      and the elapsed time
+    """
+    session = session or SPI.get_session()
+    stats = {"transfers": 0, "mismatches": 0, "elapsed_s": 0.0}
+    records = list(read_trace(path))
+
+    def run(handle):
+        for start_ns, duration_ns, op, result, payload in records:
+            if op == OP_BITRATE:
+                session.configure(bitrate_khz=struct.unpack("<i", payload)[0])
+            elif op == OP_CONFIGURE:
+                session.configure(mode=(payload[0] << 1) | payload[1])
+            elif op == OP_QUEUE_CLEAR:
+                SPI.ch_spi_queue_clear(handle)
+            elif op == OP_QUEUE_OE:
+                SPI.ch_spi_queue_oe(handle, payload[0])
+            elif op == OP_QUEUE_SS:
+                SPI.ch_spi_queue_ss(handle, payload[0])
+            elif op == OP_QUEUE_ARRAY:
+                SPI.ch_spi_queue_array(handle, array('B', payload))
+            elif op == OP_ASYNC_SUBMIT:
+                SPI.ch_spi_async_submit(handle)
+            elif op in (OP_BATCH_SHIFT, OP_ASYNC_COLLECT):
+                shift = SPI.ch_spi_batch_shift if op == OP_BATCH_SHIFT else SPI.ch_spi_async_collect
+                status, data_in = shift(handle, array('B', bytes(len(payload))))
+                stats["transfers"] += 1
+                if status in SPI.USB_ERRORS:
+                    return status
+                stats["mismatches"] += bytes(data_in) != payload
+        return SPI.CH_OK
+
+    start = time.perf_counter()
+    with session:
+        result = session.transact(run)
+    stats["elapsed_s"] = time.perf_counter() - start
+
+    if result < 0:
+        print(f"[SPI replay 실패] {SPI.ch_status_string(result)}")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["summary", "replay"])
+    parser.add_argument("trace")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        summary = summarize(args.trace)
+        print(f"[SPI trace] span {summary['span_s']:.3f} s, USB transfer {summary['transfer_s']:.3f} s")
+        for name, entry in summary["ops"].items():
+            print(f" - {name:<22} {entry['calls']:>6} calls  {entry['time_s']:.4f} s  "
+                  f"{entry['bytes']:>8} bytes  {entry['errors']} errors")
+    else:
+        stats = replay(args.trace)
+        print(f"[SPI replay] {stats['transfers']} transfers, {stats['mismatches']} mismatches, "
+              f"{stats['elapsed_s']:.3f} s")
@@ -0,0 +1,28 @@
+"""
+- Run the SPI layers against the simulated Cheetah backend (cheetah_sim.py),
+  so the tests need no adapter attached
+"""
+import os
+import sys
+
+os.environ["CHEETAH_BACKEND"] = "sim"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import cheetah_sim
+import detect
+import SPI
+
+@pytest.fixture(autouse=True)
+def sim(monkeypatch, tmp_path):
+    """
+    - Fresh simulated adapter on port 0 and a fresh shared session for every test;
+      calibrated bitrates go to a temporary file
+    """
+    cheetah_sim.sim_reset()
+    detect.pin(port=0)
+    monkeypatch.setattr(SPI, "BITRATE_FILE", str(tmp_path / "spi_bitrate.json"))
+    monkeypatch.setattr(SPI, "_session", None)
+    yield cheetah_sim.sim_device(0)
+    detect.pin()
@@ -0,0 +1,182 @@
+import pytest
+
+pytest.importorskip("pyvisa")
+
+import visa_pool
+import E36313A as e36313a
+import SMB100B as smb100b
+from E36313A import E36313A, ChannelReading, SettleTracker, compose_fields, parse_channels
+from SMB100B import SMB100B
+
+class FakeInstrument:
+    """
+    - Stand-in for a pooled VISA connection; records every message and answers queries
+      from replies ({query: response}), "1" for *OPC?
+    """
+    def __init__(self, replies=None):
+        self.replies = replies or {}
+        self.sent = []
+        self.timeout = 5000
+        self.fail = False
+        self.generation = 1
+
+    def idn(self):
+        return "FAKE,0,0,0"
+
+    def write(self, cmd):
+        if self.fail:
+            raise IOError("write failed")
+        self.sent.append(cmd)
+
+    def query(self, cmd):
+        if self.fail:
+            raise IOError("query failed")
+        self.sent.append(cmd)
+        if cmd.endswith("*OPC?"):
+            return "1"
+        return self.replies[cmd]
+
+@pytest.fixture
+def inst(monkeypatch):
+    fake = FakeInstrument()
+    monkeypatch.setattr(visa_pool, "get_resource", lambda ip, port=visa_pool.DEFAULT_PORT: fake)
+    monkeypatch.setattr(e36313a.time, "sleep", lambda s: None)
+    monkeypatch.setattr(smb100b.time, "sleep", lambda s: None)
+    return fake
+
+def channel_setting(voltage, output=True):
+    return {'voltage': voltage, 'current': 0.1, 'ovp': voltage + 2.0, 'ocp': False, 'output': output}
+
+def test_parse_channels():
+    assert parse_channels("1,2,3;4,5,6", 2, 3) == [["1", "2", "3"], ["4", "5", "6"]]
+    with pytest.raises(ValueError):
+        parse_channels("1,2;4,5,6", 2, 3)
+    with pytest.raises(ValueError):
+        parse_channels("1,2,3", 2, 3)
+
+def test_compose_fields_groups_channels():
+    cmds = compose_fields({1: {"VOLT": 1.0, "OUTP": "ON"}, 2: {"VOLT": 1.0}, 3: {"VOLT": 2.0}})
+    assert cmds == ["VOLT 1.0,(@1,2)", "VOLT 2.0,(@3)", "OUTP ON,(@1)"]
+
+def test_e36313a_sends_only_changed_fields(inst):
+    psu = E36313A()
+    assert psu.connect_device()
+
+    settings = {ch: channel_setting(1.0) for ch in (1, 2, 3)}
+    assert psu.setting(settings, [1, 2, 3]) is True
+    assert len(inst.sent) == 1
+    assert inst.sent[0].startswith("VOLT 1.0,(@1,2,3);:CURR 0.1,(@1,2,3)")
+
+    # Unchanged settings send nothing
+    assert psu.setting(settings, [1, 2, 3]) is True
+    assert len(inst.sent) == 1
+
+    settings[2] = channel_setting(1.5)
+    psu.setting(settings, [1, 2, 3])
+    assert inst.sent[-1] == "VOLT 1.5,(@2);:VOLT:PROT 3.5,(@2);*OPC?"
+
+def test_e36313a_failure_invalidates_cache(inst):
+    psu = E36313A()
+    psu.connect_device()
+    settings = {1: channel_setting(1.0)}
+    psu.setting(settings, [1])
+
+    inst.fail = True
+    assert psu.setting({1: channel_setting(2.0)}, [1]) is not True
+    inst.fail = False
+
+    # The state after a failed write is unknown, so every field is sent again
+    psu.setting(settings, [1])
+    assert inst.sent[-1].startswith("VOLT 1.0,(@1);:CURR 0.1,(@1);:VOLT:PROT 3.0,(@1)")
+
+def test_e36313a_reconnect_invalidates_cache(inst):
+    psu = E36313A()
+    psu.connect_device()
+    settings = {1: channel_setting(1.0)}
+    psu.setting(settings, [1])
+
+    # Socket reopened by the pool, e.g. after the supply was power-cycled
+    inst.generation += 1
+    psu.setting(settings, [1])
+    assert inst.sent[-1].startswith("VOLT 1.0,(@1);:CURR 0.1,(@1);:VOLT:PROT 3.0,(@1)")
+
+def test_e36313a_resends_all_fields_after_reopen_during_write(inst):
+    psu = E36313A()
+    psu.connect_device()
+    psu.setting({1: channel_setting(1.0)}, [1])
+
+    write = inst.query
+
+    def reopening_query(cmd):
+        inst.generation += 1
+        inst.query = write
+        return write(cmd)
+
+    inst.query = reopening_query
+    assert psu.setting({1: channel_setting(1.5)}, [1]) is True
+    assert inst.sent[-2] == "VOLT 1.5,(@1);:VOLT:PROT 3.5,(@1);*OPC?"
+    assert inst.sent[-1] == ("CURR 0.1,(@1);:VOLT:PROT:STAT ON,(@1);:CURR:PROT:STAT OFF,(@1);"
+                             ":OUTP ON,(@1);*OPC?")
+
+def test_e36313a_measure_all(inst):
+    inst.replies["MEAS:VOLT? (@1,2,3);:MEAS:CURR? (@1,2,3)"] = "1.0,2.0,3.0;0.1,0.2,0.3"
+    psu = E36313A()
+    psu.connect_device()
+    assert psu.measure_all() == {1: ChannelReading(1.0, 0.1), 2: ChannelReading(2.0, 0.2),
+                                 3: ChannelReading(3.0, 0.3)}
+
+def test_settle_tracker():
+    tracker = SettleTracker([1], stable_count=3)
+    assert tracker.update({1: ChannelReading(1.0, 0.1)}, 0.0) is None
+    assert tracker.update({1: ChannelReading(1.5, 0.1)}, 0.1) is None
+    assert tracker.update({1: ChannelReading(1.501, 0.1)}, 0.2) is None
+    assert tracker.update({1: ChannelReading(1.502, 0.1)}, 0.3) == 0.1
+
+    # With targets, readings off the setpoint never count
+    tracker = SettleTracker([1], targets={1: 5.0}, stable_count=2)
+    assert tracker.update({1: ChannelReading(4.0, 0.1)}, 0.0) is None
+    assert tracker.update({1: ChannelReading(4.0, 0.1)}, 0.1) is None
+    assert tracker.update({1: ChannelReading(4.95, 0.1)}, 0.2) is None
+    assert tracker.update({1: ChannelReading(4.95, 0.1)}, 0.3) == 0.2
+
+def test_smb100b_skips_unchanged_values(inst):
+    sgu = SMB100B()
+    sgu.connect_device()
+
+    sgu.set_frequency(1e9)
+    sgu.set_power(-10)
+    sgu.rf_on()
+    assert inst.sent == ["SOUR:FREQ 1000000000.0", "SOUR:POW -10", "OUTP ON"]
+
+    sgu.set_frequency(1e9)
+    sgu.set_power(-10)
+    sgu.rf_on()
+    assert len(inst.sent) == 3
+
+    sgu.set_frequency(2e9)
+    assert inst.sent[-1] == "SOUR:FREQ 2000000000.0"
+
+def test_smb100b_reconnect_invalidates_cache(inst):
+    sgu = SMB100B()
+    sgu.connect_device()
+    sgu.set_frequency(1e9)
+    sgu.rf_on()
+
+    inst.generation += 1
+    sgu.set_frequency(1e9)
+    sgu.rf_on()
+    assert inst.sent[-2:] == ["SOUR:FREQ 1000000000.0", "OUTP ON"]
+
+def test_smb100b_refresh_and_invalidate(inst):
+    inst.replies["SOUR:FREQ?;:SOUR:POW?;:OUTP?"] = "1000000000;-10;1"
+    sgu = SMB100B()
+    sgu.connect_device()
+
+    assert sgu.refresh() == (1e9, -10.0, True)
+    sgu.set_frequency(1e9)
+    sgu.rf_on()
+    assert inst.sent == ["SOUR:FREQ?;:SOUR:POW?;:OUTP?"]
+
+    sgu.invalidate()
+    sgu.set_frequency(1e9)
+    assert inst.sent[-1] == "SOUR:FREQ 1000000000.0"
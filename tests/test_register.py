@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+import SPI
+from SPI import get_session
+from register import REGISTER_MAP, RegisterShadow, calibrate_bitrate, decode, encode
+
+def test_encode_decode_round_trip():
+    for address, reg in REGISTER_MAP.items():
+        fields = {name: (1 << field.width) - 1 for name, field in reg.fields.items()}
+        decoded = decode(address, encode(address, **fields))
+        assert {name: int(value) for name, value in decoded.items()} == fields
+
+def test_encode_keeps_other_bits():
+    word = encode(0, base=0xFFFF, kp=0)
+    assert int(word) == 0xFFFF & ~REGISTER_MAP[0].fields["kp"].mask
+    assert int(encode(0)) == REGISTER_MAP[0].reset
+
+def test_encode_grid_broadcast():
+    words = encode(0, kp=np.arange(16)[:, None], ki=np.arange(4)[None, :])
+    assert words.shape == (16, 4)
+    fields = decode(0, words)
+    assert fields["kp"][7, 2] == 7
+    assert fields["ki"][7, 2] == 2
+
+def test_encode_out_of_range():
+    with pytest.raises(ValueError):
+        encode(0, kp=16)
+    with pytest.raises(ValueError):
+        encode(1, init_dco=-1)
+
+def test_shadow_skips_unchanged_registers(sim):
+    with get_session():
+        shadow = RegisterShadow()
+        shadow.write({0: 0x1234, 1: 0x0087})
+        batches = sim.stats["async_batches"]
+        assert shadow.write({0: 0x1234, 1: 0x0087}) == {0: 0x1234, 1: 0x0087}
+        assert sim.stats["async_batches"] == batches
+
+        shadow.write({0: 0x1234, 1: 0x0088})
+        assert sim.stats["async_batches"] == batches + 1
+    assert sim.registers[1] == 0x0088
+
+def test_shadow_verify_takes_read_value(sim):
+    with get_session() as session:
+        shadow = RegisterShadow(session)
+        assert shadow.write({0: 0x1234}, verify=True) == {0: 0x1234}
+
+        # Above the reliable bitrate bit 0 of every byte read back flips;
+        # the read value is kept in the shadow
+        sim.max_reliable_khz = 1000
+        session.configure(bitrate_khz=4000)
+        assert shadow.write({0: 0x4320}, verify=True) == {0: 0x4221}
+        assert sim.registers[0] == 0x4320
+
+        # The next write of the same value is sent again
+        session.configure(bitrate_khz=1000)
+        batches = sim.stats["async_batches"]
+        assert shadow.write({0: 0x4320}, verify=True) == {0: 0x4320}
+        assert sim.stats["async_batches"] == batches + 2
+
+def test_shadow_load_and_invalidate(sim):
+    sim.registers[15] = 0x0004
+    shadow = RegisterShadow()
+    assert shadow.load()[15] == 0x0004
+    assert shadow.get(15) == 0x0004
+    shadow.invalidate(15)
+    assert shadow.get(15) is None
+
+def test_calibrate_bitrate(sim):
+    sim.max_reliable_khz = 4000
+    sim.registers[19] = 0x1234
+    # Status bits elsewhere in the register file do not affect calibration
+    sim.registers[5] = 0x0001
+
+    assert calibrate_bitrate(rounds=1) == 4000
+    assert sim.registers[19] == 0x1234
+    with open(SPI.BITRATE_FILE, encoding="utf-8") as f:
+        assert json.load(f) == {str(sim.unique_id): 4000}
+    assert SPI.load_bitrates() == {sim.unique_id: 4000}
@@ -0,0 +1,101 @@
+import numpy as np
+
+import SPI
+from SPI import AsyncSPI, get_session, read_register, read_words, write_register, write_registers
+
+def test_session_opens_adapter_once_per_sweep(sim):
+    with get_session():
+        for value in range(32):
+            assert write_registers({0: value, 1: 0x87}) >= 0
+            assert read_words(2, 20) is not None
+    assert sim.stats["opens"] == 1
+    assert sim.handle is None
+
+def test_write_registers_single_batch(sim):
+    with get_session():
+        write_registers({0: 0x1234, 1: 0x0087, 15: 0x0004})
+    assert sim.stats["shifts"] == 1
+    assert sim.registers[0] == 0x1234
+    assert sim.registers[1] == 0x0087
+    assert sim.registers[15] == 0x0004
+
+def test_write_register_hex_string(sim):
+    write_register(19, "BEEF")
+    assert sim.registers[19] == 0xBEEF
+
+def test_read_words_into_buffer(sim):
+    sim.registers[:3] = [0x1111, 0x2222, 0x3333]
+    out = np.zeros(20, dtype=np.uint16)
+    words = read_words(2, 20, out=out)
+    assert words is out
+    assert out[:3].tolist() == [0x1111, 0x2222, 0x3333]
+
+def test_read_register_returns_copy(sim):
+    sim.registers[0] = 0xABCD
+    first = read_register(2, 1)
+    sim.registers[0] = 0x0000
+    read_register(2, 1)
+    assert bytes(first) == b"\xab\xcd"
+
+def test_decode_words():
+    assert SPI.decode_words(bytes([0x12, 0x34, 0xAB, 0xCD])).tolist() == [0x1234, 0xABCD]
+
+def test_async_spi_results_in_submission_order(sim):
+    with AsyncSPI(depth=4) as spi:
+        writes = [spi.write({0: value}) for value in (0x0001, 0x0002, 0x0003)]
+        reads = [spi.read(2, 1) for _ in range(3)]
+        assert [spi.wait(f) for f in writes] == [3, 3, 3]
+        assert [int(spi.wait(f)[0]) for f in reads] == [0x0003] * 3
+
+    with AsyncSPI(depth=2) as spi:
+        futures = []
+        for value in range(6):
+            futures.append(spi.write({1: value}))
+            futures.append(spi.read(2, 2))
+        values = [int(spi.wait(f)[1]) for f in futures[1::2]]
+    assert values == list(range(6))
+
+def test_async_spi_depth_bound(sim, monkeypatch):
+    in_flight = []
+    submit = SPI.ch_spi_async_submit
+
+    def counting_submit(handle):
+        result = submit(handle)
+        in_flight.append(len(sim.inflight))
+        return result
+
+    monkeypatch.setattr(SPI, "ch_spi_async_submit", counting_submit)
+    with AsyncSPI(depth=3) as spi:
+        futures = [spi.write({0: value}) for value in range(10)]
+    assert max(in_flight) == 3
+    assert all(f.done() for f in futures)
+    assert not sim.inflight
+
+def test_async_spi_read_into_buffer(sim):
+    sim.registers[:2] = [0x00AA, 0x0055]
+    out = np.zeros(20, dtype=np.uint16)
+    with AsyncSPI() as spi:
+        assert spi.wait(spi.read(2, 2, out)) is out
+    assert out[:2].tolist() == [0x00AA, 0x0055]
+
+def test_session_reopens_after_usb_error(sim):
+    session = get_session()
+    with session:
+        # Adapter handle lost underneath the session
+        SPI.ch_close(session.open())
+        assert write_registers({0: 0x5A5A}) >= 0
+    assert sim.registers[0] == 0x5A5A
+    assert sim.stats["opens"] == 2
+
+def test_batching_beats_single_writes(sim):
+    values = {0: 0x1234, 1: 0x0087, 15: 0x0004}
+    with get_session():
+        start = sim.clock
+        for address, value in values.items():
+            write_registers({address: value})
+        single = sim.clock - start
+
+        start = sim.clock
+        write_registers(values)
+        batched = sim.clock - start
+    assert batched < single / 2
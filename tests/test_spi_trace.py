@@ -0,0 +1,42 @@
+from SPI import get_session, read_words, write_registers
+from spi_trace import TraceRecorder, read_trace, replay, summarize, OP_BATCH_SHIFT
+
+def test_record_and_replay(sim, tmp_path):
+    path = tmp_path / "spi_trace.bin"
+    with TraceRecorder(path), get_session():
+        for value in range(8):
+            write_registers({0: value, 1: 0x87})
+            read_words(2, 20)
+
+    summary = summarize(path)
+    assert summary["ops"]["ch_spi_batch_shift"]["calls"] == 24
+    assert summary["ops"]["ch_spi_batch_shift"]["errors"] == 0
+
+    stats = replay(path)
+    assert stats["transfers"] == 24
+    assert stats["mismatches"] == 0
+
+def test_replay_detects_changed_device(sim, tmp_path):
+    path = tmp_path / "spi_trace.bin"
+    sim.registers[3] = 0x1111
+    with TraceRecorder(path):
+        read_words(2, 20)
+
+    sim.registers[3] = 0x2222
+    assert replay(path)["mismatches"] == 1
+
+def test_large_payload(sim, tmp_path):
+    path = tmp_path / "spi_trace.bin"
+    with TraceRecorder(path):
+        assert read_words(2, 40000) is not None
+
+    lengths = [len(payload) for _, _, op, _, payload in read_trace(path) if op == OP_BATCH_SHIFT]
+    assert max(lengths) == 80000
+
+def test_recorder_restores_spi_calls(tmp_path):
+    import SPI
+
+    original = SPI.ch_spi_batch_shift
+    with TraceRecorder(tmp_path / "spi_trace.bin"):
+        assert SPI.ch_spi_batch_shift is not original
+    assert SPI.ch_spi_batch_shift is original
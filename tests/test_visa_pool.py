@@ -0,0 +1,94 @@
+import pytest
+
+pyvisa = pytest.importorskip("pyvisa")
+
+import visa_pool
+from pyvisa.constants import StatusCode
+
+class FakeSocket:
+    """
+    - Stand-in for a pyvisa socket resource; fail maps an operation ("write", "read")
+      to the exception raised on its next call
+    """
+    def __init__(self, log, fail):
+        self.log = log
+        self.fail = fail
+        self.reply = ""
+        self.timeout = 0
+        self.closed = False
+
+    def __check(self, operation):
+        error = self.fail.pop(operation, None)
+        if error:
+            raise error
+
+    def write(self, cmd):
+        self.__check("write")
+        self.log.append(cmd)
+        self.reply = "FAKE,0,0,0" if cmd == "*IDN?" else "1"
+
+    def read(self):
+        self.__check("read")
+        return self.reply
+
+    def query(self, cmd):
+        self.write(cmd)
+        return self.read()
+
+    def close(self):
+        self.closed = True
+
+class FakeManager:
+    def __init__(self):
+        self.log = []
+        self.fail = {}
+        self.sockets = []
+
+    def open_resource(self, name, **kwargs):
+        self.sockets.append(FakeSocket(self.log, self.fail))
+        return self.sockets[-1]
+
+@pytest.fixture
+def manager(monkeypatch):
+    fake = FakeManager()
+    monkeypatch.setattr(visa_pool, "resource_manager", lambda: fake)
+    return fake
+
+def timeout_error():
+    error = pyvisa.errors.VisaIOError.__new__(pyvisa.errors.VisaIOError)
+    error.error_code = StatusCode.error_timeout
+    return error
+
+def test_send_failure_is_retried(manager):
+    res = visa_pool.PooledResource("10.0.0.1")
+    res.open()
+    manager.fail["write"] = ConnectionResetError("stale socket")
+
+    assert res.query("*TRG;*OPC?") == "1"
+    assert manager.log.count("*TRG;*OPC?") == 1
+    assert res.generation == 2
+    assert manager.sockets[0].closed
+
+def test_receive_failure_is_not_retried(manager):
+    res = visa_pool.PooledResource("10.0.0.1")
+    res.open()
+    manager.fail["read"] = ConnectionResetError("dropped")
+
+    with pytest.raises(ConnectionResetError):
+        res.query("*TRG;*OPC?")
+    assert manager.log.count("*TRG;*OPC?") == 1
+    assert manager.sockets[0].closed
+
+    # The next call reopens the socket
+    assert res.query("*OPC?") == "1"
+    assert res.generation == 2
+
+def test_timeout_closes_socket(manager):
+    res = visa_pool.PooledResource("10.0.0.1")
+    res.open()
+    manager.fail["read"] = timeout_error()
+
+    with pytest.raises(pyvisa.errors.VisaIOError):
+        res.query("INIT:IMM;*OPC?")
+    assert manager.sockets[0].closed
+    assert res.generation == 1
@@ -0,0 +1,237 @@
+"""
+- Process-wide VISA connection pool shared by the instrument drivers
+- One ResourceManager for the process and one socket per IP:port, reused across connects
+"""
+import threading
+
+import pyvisa
+from pyvisa.constants import StatusCode
+
+DEFAULT_PORT = 5025
+DEFAULT_TIMEOUT_MS = 5000
+
+_rm = None
+_pool: dict[str, "PooledResource"] = {}
+_lock = threading.Lock()
+
+# Traffic over all pooled connections (bytes include the termination character)
+counters = {"commands": 0, "bytes_sent": 0, "bytes_received": 0}
+_counter_lock = threading.Lock()
+
+def _count(commands=0, sent=0, received=0):
+    with _counter_lock:
+        counters["commands"] += commands
+        counters["bytes_sent"] += sent
+        counters["bytes_received"] += received
+
+def snapshot():
+    """
+    - Return a copy of the traffic counters
+    """
+    with _counter_lock:
+        return dict(counters)
+
+def resource_manager():
+    """
+    - Return the shared pyvisa ResourceManager
+    """
+    global _rm
+
+    with _lock:
+        if _rm is None:
+            _rm = pyvisa.ResourceManager()
+        return _rm
+
+def _is_timeout(e):
+    return isinstance(e, pyvisa.errors.VisaIOError) and e.error_code == StatusCode.error_timeout
+
+class PooledResource:
+    def __init__(self, ip, port=DEFAULT_PORT):
+        """
+        - Initialize the class
+        - Wraps a pyvisa socket resource; a command that could not be sent is retried
+          once on a reopened socket
+        """
+        self.__ip = ip
+        self.__port = port
+        self.__inst = None
+        self.__idn = None
+        self.__generation = 0
+        self.__timeout_ms = DEFAULT_TIMEOUT_MS
+        self.__lock = threading.RLock()
+
+    @property
+    def resource_name(self):
+        return f"TCPIP0::{self.__ip}::{self.__port}::SOCKET"
+
+    @property
+    def generation(self):
+        """
+        - Number of times the socket has been opened; drivers compare it to notice that
+          the connection was re-established and their cached instrument state is stale
+        """
+        return self.__generation
+
+    @property
+    def timeout(self):
+        return self.__timeout_ms
+
+    @timeout.setter
+    def timeout(self, timeout_ms):
+        with self.__lock:
+            self.__timeout_ms = timeout_ms
+            if self.__inst is not None:
+                self.__inst.timeout = timeout_ms
+
+    def open(self):
+        """
+        - Open the socket if it is not open yet and read *IDN? once
+        """
+        with self.__lock:
+            if self.__inst is None:
+                # The socket connect is bounded by the same timeout as I/O
+                inst = resource_manager().open_resource(self.resource_name, open_timeout=self.__timeout_ms)
+                inst.write_termination = '\n'
+                inst.read_termination = '\n'
+                inst.timeout = self.__timeout_ms
+                try:
+                    self.__idn = inst.query("*IDN?").strip()
+                except Exception:
+                    inst.close()
+                    raise
+                self.__inst = inst
+                self.__generation += 1
+            return self.__inst
+
+    def close(self):
+        """
+        - Close the socket; the next call reopens it
+        """
+        with self.__lock:
+            if self.__inst is not None:
+                try:
+                    self.__inst.close()
+                except Exception as e:
+                    print(f"[VISA 종료 오류] {self.resource_name}: {e}")
+                self.__inst = None
+
+    def is_alive(self):
+        """
+        - Probe the open socket with *OPC?
+        """
+        with self.__lock:
+            if self.__inst is None:
+                return False
+            try:
+                return self.__inst.query("*OPC?").strip() == "1"
+            except Exception:
+                return False
+
+    def idn(self):
+        """
+        - Return the *IDN? response read when the socket was opened
+        """
+        self.open()
+        return self.__idn
+
+    def __failed(self, e):
+        """
+        - Close the socket after an I/O error; after a timeout the instrument's late reply
+          would otherwise stay buffered and be read as the answer to the next query
+        """
+        if _is_timeout(e):
+            print(f"[VISA 시간 초과] {self.resource_name}: 연결 재설정")
+        else:
+            print(f"[VISA 연결 오류] {self.resource_name}: {e}")
+        self.close()
+
+    def __call(self, send, receive=None):
+        """
+        - Run send(inst), then receive(inst) if given, and return the last result
+        - Only a failure to open the socket or to send is retried once on a reopened
+          socket, since the command has not reached the instrument. After a failure while
+          receiving, the command may already have run (e.g. *TRG), so the socket is closed
+          and the error raised; the next call reopens it
+        """
+        with self.__lock:
+            try:
+                inst = self.open()
+                result = send(inst)
+            except Exception as e:
+                self.__failed(e)
+                if _is_timeout(e):
+                    raise
+                inst = self.open()
+                result = send(inst)
+
+            if receive is None:
+                return result
+            try:
+                return receive(inst)
+            except Exception as e:
+                self.__failed(e)
+                raise
+
+    def write(self, cmd):
+        result = self.__call(lambda inst: inst.write(cmd))
+        _count(1, len(cmd) + 1)
+        return result
+
+    def query(self, cmd):
+        resp = self.__call(lambda inst: inst.write(cmd), lambda inst: inst.read())
+        _count(1, len(cmd) + 1, len(resp) + 1)
+        return resp
+
+    def read(self):
+        resp = self.__call(lambda inst: None, lambda inst: inst.read())
+        _count(received=len(resp) + 1)
+        return resp
+
+    def write_raw(self, data):
+        result = self.__call(lambda inst: inst.write_raw(data))
+        _count(1, len(data))
+        return result
+
+    def read_raw(self):
+        data = self.__call(lambda inst: None, lambda inst: inst.read_raw())
+        _count(received=len(data))
+        return data
+
+    def query_binary_values(self, cmd, **kwargs):
+        values = self.__call(lambda inst: inst.write(cmd), lambda inst: inst.read_binary_values(**kwargs))
+        # Payload size; the short block header is not counted
+        _count(1, len(cmd) + 1, getattr(values, "nbytes", 4 * len(values)) + 1)
+        return values
+
+    def clear(self):
+        return self.__call(lambda inst: inst.clear())
+
+def get_resource(ip, port=DEFAULT_PORT):
+    """
+    - Return the pooled connection for ip:port, opening it or reopening it if the
+      health probe fails
+    """
+    key = f"{ip}:{port}"
+    with _lock:
+        res = _pool.get(key)
+        if res is None:
+            res = _pool[key] = PooledResource(ip, port)
+
+    if not res.is_alive():
+        res.close()
+        res.open()
+    return res
+
+def close_all():
+    """
+    - Close every pooled connection and the ResourceManager
+    """
+    global _rm
+
+    with _lock:
+        for res in _pool.values():
+            res.close()
+        _pool.clear()
+        if _rm is not None:
+            _rm.close()
+            _rm = None